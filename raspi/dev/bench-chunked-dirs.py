@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Compare file creation and lookup in one flat session dir against 1000-frame chunk dirs.
+
+Run it on the drive you scan to, e.g. a freshly mounted exFAT stick:
+
+    python3 raspi/dev/bench-chunked-dirs.py /mnt/usb --files 50000
+
+Every file gets a small payload so the directory, not the data, dominates. Both trees
+are removed again afterwards.
+"""
+import argparse
+import os
+import shutil
+import time
+
+CHUNK_FRAMES = 1000  # keep in sync with SESSION_CHUNK_FRAMES in scanner.py
+
+
+def flat_relpath(index: int) -> str:
+    return "{:08d}.dng".format(index)
+
+
+def chunked_relpath(index: int) -> str:
+    return os.path.join("{:04d}".format(index // CHUNK_FRAMES), "{:08d}.dng".format(index))
+
+
+def run(root: str, files: int, payload: bytes, relpath, report_every: int) -> dict:
+    os.makedirs(root)
+    started = time.perf_counter()
+    last = started
+    slowest_batch = 0.0
+    for index in range(files):
+        path = os.path.join(root, relpath(index))
+        if index % CHUNK_FRAMES == 0:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as handle:
+            handle.write(payload)
+        if (index + 1) % report_every == 0:
+            now = time.perf_counter()
+            slowest_batch = max(slowest_batch, now - last)
+            print(f"  {index + 1:6d} files, last {report_every} took {now - last:.2f}s", flush=True)
+            last = now
+    os.sync()
+    create_s = time.perf_counter() - started
+
+    # Look up the newest frames, like resuming or verifying the tail of a session does.
+    started = time.perf_counter()
+    for index in range(max(0, files - 1000), files):
+        os.stat(os.path.join(root, relpath(index)))
+    lookup_s = time.perf_counter() - started
+    return {"create_s": create_s, "slowest_batch_s": slowest_batch, "lookup_ms": lookup_s * 1000}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("target", help="directory on the drive under test")
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--payload", type=int, default=4096, help="bytes per file")
+    parser.add_argument("--report-every", type=int, default=5000)
+    args = parser.parse_args()
+
+    payload = os.urandom(args.payload)
+    results = {}
+    for name, relpath in (("flat", flat_relpath), ("chunked", chunked_relpath)):
+        root = os.path.join(args.target, f".bench-{name}-{os.getpid()}")
+        print(f"{name}: creating {args.files} files in {root}")
+        try:
+            results[name] = run(root, args.files, payload, relpath, args.report_every)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print()
+    print(f"{'layout':<8} {'create':>10} {'slowest batch':>14} {'1000 lookups':>13}")
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['create_s']:>9.2f}s {result['slowest_batch_s']:>13.2f}s "
+            f"{result['lookup_ms']:>10.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
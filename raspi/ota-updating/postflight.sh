@@ -10,3 +10,16 @@ set -euo pipefail
 # - Minimal environment; HOME is /root and PATH may be limited.
 # - Working directory is the repo root (/home/pi/Filmkorn-Raw-Scanner).
 # - No TTY/interactive input.
+
+# Pairings made before frames were published under hidden names keep an lsyncd-to-host.conf that
+# syncs the half-written files too, and older ones don't share the scanner's ssh connection either.
+# Write it again for the stored destination.
+raspi_dir="/home/pi/Filmkorn-Raw-Scanner/raspi"
+lsyncd_conf="${raspi_dir}/lsyncd-to-host.conf"
+if [ -f "$lsyncd_conf" ] && [ -s "${raspi_dir}/.user_and_host" ] && [ -s "${raspi_dir}/.host_path" ] \
+  && ! { grep -qF 'exclude = { ".*" }' "$lsyncd_conf" && grep -qF 'ControlPath = "/tmp/filmkorn-ssh-%C"' "$lsyncd_conf"; }
+then
+  echo "Updating lsyncd-to-host.conf for $(cat "${raspi_dir}/.user_and_host")"
+  sudo -u pi "${raspi_dir}/pairing/write-lsyncd-conf.sh" \
+    "$(cat "${raspi_dir}/.user_and_host")" "$(cat "${raspi_dir}/.host_path")" "$lsyncd_conf"
+fi
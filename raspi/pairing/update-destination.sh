@@ -56,7 +56,6 @@ conf_path="${repo_root}/raspi/lsyncd-to-host.conf"
 dest_path="${repo_root}/raspi/.scan_destination"
 user_and_host_path="${repo_root}/raspi/.user_and_host"
 host_path_path="${repo_root}/raspi/.host_path"
-temp_conf="$(mktemp)"
 rawpath="${rawpath%/}"
 
 info "Validating host and path..."
@@ -88,45 +87,7 @@ then
 fi
 
 info "🐧 Writing config to use for remote scans..."
-if ! cat << EOFCONFIGFILE > "$temp_conf"
-settings {
-  logfile = "/tmp/lsyncd.log",
-  statusFile = "/tmp/lsyncd.status",
-  nodaemon = false,
-  pidfile = "/tmp/lsyncd.pid",
-  insist = true,
-  maxProcesses = 1
-}
-
-sync {
-  default.rsyncssh,
-  source = "/mnt/ramdisk/",
-  host = "${userhost}",
-  targetdir = "${rawpath}/",
-  delete = false,
-  rsync = {
-    archive = true,
-    compress = false,
-    dry_run = false,
-    rsync_path = "/opt/homebrew/bin/rsync",
-    verbose = true,
-    whole_file = true,
-    _extra = {
-      "--remove-source-files"
-    }
-  },
-  ssh = {
-    identityFile = "/home/pi/.ssh/id_filmkorn-scanner_ed25519"
-  }
-}
-EOFCONFIGFILE
-then
-  echo "🐧 Failed to write lsyncd-to-host.conf" >&2
-  rm -f "$temp_conf"
-  exit 1
-fi
-
-mv "$temp_conf" "$conf_path"
+"${repo_root}/raspi/pairing/write-lsyncd-conf.sh" "${userhost}" "${rawpath}" "${conf_path}"
 echo "${rawpath}" > "$dest_path"
 echo "${userhost}" > "$user_and_host_path"
 echo "${rawpath}" > "$host_path_path"
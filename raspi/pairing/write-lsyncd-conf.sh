@@ -0,0 +1,64 @@
+#!/bin/bash
+set -euo pipefail
+
+# Writes lsyncd-to-host.conf for the given destination. Called by update-destination.sh when pairing,
+# and by the OTA postflight to bring the config of an existing pairing up to date.
+
+if [ "$#" -ne 3 ]; then
+  echo "Usage: $0 user@host path conf-path" >&2
+  exit 1
+fi
+
+userhost="$1"
+rawpath="${2%/}"
+conf_path="$3"
+temp_conf="$(mktemp)"
+
+if ! cat << EOFCONFIGFILE > "$temp_conf"
+settings {
+  logfile = "/tmp/lsyncd.log",
+  statusFile = "/tmp/lsyncd.status",
+  nodaemon = false,
+  pidfile = "/tmp/lsyncd.pid",
+  insist = true,
+  maxProcesses = 1
+}
+
+sync {
+  default.rsyncssh,
+  source = "/mnt/ramdisk/",
+  host = "${userhost}",
+  targetdir = "${rawpath}/",
+  delete = false,
+  -- Frames are written under a hidden name and renamed when complete, so only finished files
+  -- are synced and there is no need to wait for writes to settle.
+  exclude = { ".*" },
+  delay = 1,
+  rsync = {
+    archive = true,
+    compress = false,
+    dry_run = false,
+    rsync_path = "/opt/homebrew/bin/rsync",
+    verbose = true,
+    whole_file = true,
+    _extra = {
+      "--remove-source-files"
+    }
+  },
+  ssh = {
+    identityFile = "/home/pi/.ssh/id_filmkorn-scanner_ed25519",
+    -- Reuse the scanner's multiplexed connection if it is up, connect normally otherwise.
+    options = {
+      ControlMaster = "no",
+      ControlPath = "/tmp/filmkorn-ssh-%C"
+    }
+  }
+}
+EOFCONFIGFILE
+then
+  echo "🐧 Failed to write lsyncd-to-host.conf" >&2
+  rm -f "$temp_conf"
+  exit 1
+fi
+
+mv "$temp_conf" "$conf_path"
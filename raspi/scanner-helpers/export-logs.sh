@@ -28,9 +28,11 @@ cleanup() {
 trap cleanup EXIT
 
 scanner_log="/home/pi/Filmkorn-Raw-Scanner/raspi/scanner.log"
-if [ -f "$scanner_log" ]; then
-  cp "$scanner_log" "${tmpdir}/scanner.log"
-fi
+for log_file in "$scanner_log" "$scanner_log".[0-9]*; do
+  if [ -f "$log_file" ]; then
+    cp "$log_file" "${tmpdir}/$(basename "$log_file")"
+  fi
+done
 
 journalctl -b -o short-iso --no-pager > "${tmpdir}/journalctl-boot.log"
 
@@ -2,10 +2,13 @@
 """Raspi-side Scan Control Glue communicating between Raspi, Arduino and the Raspi HQ Cam"""
 
 from time import sleep
-from typing import Optional
+from typing import Callable, Optional
 import argparse
 import enum
 import errno
+import hashlib
+import io
+import json
 import math
 import subprocess
 import sys
@@ -13,19 +16,32 @@ import signal
 import time
 import os
 import os.path
+import queue
 import shlex
 import secrets
 import atexit
+import select
+import socket
+import struct
 import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import re
+try:
+    import xxhash  # optional: much faster than blake2b on the Pi
+except ImportError:
+    xxhash = None
 import RPi.GPIO as GPIO
 import logging
+import logging.handlers
 
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from smbus2 import SMBus
-from picamera2 import Picamera2, Preview
+from picamera2 import MappedArray, Picamera2, Preview
 from libcamera import Transform, controls
 from datetime import datetime
 
@@ -35,9 +51,154 @@ FULL_RESOLUTION = (4056, 3840)
 
 SENSOR_BIT_DEPTH = 12
 
+# --- Logging ---
+LOG_PATH = "scanner.log"  # relative to the raspi dir
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5  # scanner.log.1 ... scanner.log.5
+LOG_BATCH_RECORDS = 256  # records written with one write() at most...
+LOG_BATCH_S = 0.2  # ...and collected for at most this long after the first one
+
 # --- Controller MCU (ATmega328P) Power Switch ---
 UC_POWER_GPIO = 16  # GPIO16 (physical pin 36) enables µC power switch on the controller PCB
 UC_POWER_BOOT_DELAY_S = 0.5  # allow the ATmega328P to boot before first I2C transaction
+I2C_SETTLE_S = 1.0  # measured from µC power-on, avoids i2c IO Errors on the first transaction
+
+# Startup orchestration
+STARTUP_CACHE_PATH = ".startup_cache.json"  # results that survive reboots (relative to the raspi dir)
+STARTUP_STEP_TIMEOUT_S = 15.0  # don't let a single startup step hold back "ready to scan"
+MCU_VERIFY_TIMEOUT_S = 60.0
+MCU_SIGNATURE_TIMEOUT_S = 10.0
+
+# Session journal. Lives on the SD card: a journal on the ramdisk would vanish with the power loss it is meant for.
+SESSION_JOURNAL_DIR = ".sessions"  # relative to the raspi dir, like STARTUP_CACHE_PATH
+SESSION_JOURNAL_FSYNC_FRAMES = 24  # fsync at least every this many records...
+SESSION_JOURNAL_FSYNC_S = 2.0  # ...or this often, whichever comes first
+SESSION_JOURNAL_SYNC_CHECK_S = 1.0  # how often to look for frames lsyncd has shipped
+SESSION_JOURNAL_KEEP = 20  # finished journals to keep around
+SESSION_CHUNK_FRAMES = 1000  # frames per numbered sub-dir; keeps exFAT directory lookups fast
+
+# Frame integrity (local mode: frames leave the ramdisk only after the USB copy read back correctly)
+FRAME_HASH_NAME = "xxh3" if xxhash is not None else "blake2b"
+FRAME_VERIFY_WORKERS = 2
+FRAME_VERIFY_POLL_S = 0.5
+FRAME_VERIFY_MAX_ATTEMPTS = 3
+
+# Raw frame analysis (12-bit DN, on a decimated view of the packed raw buffer)
+SENSOR_WHITE_LEVEL = (1 << SENSOR_BIT_DEPTH) - 1
+RAW_SAMPLE_STEP = 24  # every 24th Bayer quad in both directions, ~5k quads at 4K, well under 1 ms
+BLANK_FRAME_MAX_STD = 48.0  # green spread below this counts as near-uniform (leader, black, light-struck)
+BLANK_FRAME_BLACK_DN = 40.0  # mean within this of the black level: black frame
+BLANK_FRAME_CLEAR_FRACTION = 0.85  # mean above this share of the range: clear leader / light-struck
+BLANK_FRAME_MODES = ("keep", "skip", "placeholder")
+EXPOSURE_STATS_FIELDS = ("mean", "p01", "p50", "p99", "clipped", "crushed")
+EXPOSURE_CLIP_DN = SENSOR_WHITE_LEVEL - 32
+EXPOSURE_CRUSH_DN = 8.0  # above the black level
+EXPOSURE_CLIP_WARN_FRACTION = 0.002  # overlay warning once 0.2% of a channel clips
+EXPOSURE_STATS_QUEUE_SIZE = 16  # frames waiting for the stats worker; more are dropped, never waited for
+WEAVE_DEFAULT_ROI = "0,0,0.3,1"  # x,y,width,height as fractions of the raw: the perforation side of the gate
+WEAVE_SAMPLE_STEP = 2  # every 2nd Bayer quad: a green sample every 4 sensor pixels
+WEAVE_BANDWIDTH = 0.08  # cycles per sample kept by the correlation's Gaussian low-pass
+WEAVE_QUEUE_SIZE = 8  # samples waiting for the weave worker; more are dropped and the next one bridges the gap
+CROP_SAMPLE_STEP = 2  # Bayer quads between samples when looking for the gate edges
+CROP_MIN_CONTRAST = 24  # levels (of 256) between the gate surround and the lit aperture
+# Smallest gate image the optics produce: a Regular 8 aperture (4.8 x 3.5 mm) at 1:1 on the 1.55 µm pixels
+# is about 3100 x 2260 at 4K; this leaves room for a little less magnification. Anything smaller is not the gate.
+CROP_MIN_APERTURE = {"4K": (2400, 1800), "2K": (1200, 900)}
+CROP_EDGE_SPAN = 5  # samples on either side of an edge its step is measured over
+CROP_MARGIN = 0.02  # share of the raw added on every side, so gate weave never cuts into the picture
+SCENE_HISTOGRAM_BINS = 16  # per channel, on a square-root scale
+SCENE_CUT_MIN_SCORE = 0.3  # histogram distance (0..1) a cut needs at the very least...
+SCENE_CUT_RATIO = 3.0  # ...and this many times the median distance of the recent frames
+SCENE_CUT_WINDOW = 24  # recent frame distances the median is taken over
+SCENE_MIN_FRAMES = 12  # shortest scene; camera start flashes don't make cuts of their own
+SCENE_QUEUE_SIZE = 32
+EDL_FPS = 18  # the timeline rate of the Resolve presets in resolve/
+EDL_MAX_EVENTS = 999  # CMX3600 event numbers have three digits; longer reels get more EDL files
+EXPOSURE_ASSIST_BURST_FRAMES = 8  # preview frames with identical AE settings per recommendation
+EXPOSURE_ASSIST_PERCENTILE = 0.995  # brightest film area: the base on negatives, highlights on reversal
+EXPOSURE_ASSIST_TARGET = 0.90  # place it at this share of the range above black
+
+# Focus aid in the 3:1 and 6:1 zoom modes (on the 640x480 main stream, which follows ScalerCrop)
+FOCUS_OVERLAY_INTERVAL_S = 0.2  # overlay redraws; the metric itself runs on every preview frame
+FOCUS_PEAKING_THRESHOLD = 48  # |Laplacian| of the green channel that counts as an in-focus edge
+FOCUS_PEAKING_COLOR = (255, 40, 40, 255)
+
+# Negative preview (display only: LUTs on the XBGR8888 main stream, the raw stream is never touched)
+NEGATIVE_BASE_SETTLE_FRAMES = 15  # let AE settle after the lamp comes on before sampling the film base
+NEGATIVE_BASE_PERCENTILE = 99.5  # the clear film base is the brightest part of a negative
+NEGATIVE_DENSE_PERCENTILE = 0.5
+NEGATIVE_BASE_ROI = 0.6  # central share of the preview sampled, clear of the sprocket holes and the gate edges
+NEGATIVE_BASE_RANGE = (40, 250)  # 8-bit film base levels that are plausible: darker is no lamp, brighter clips
+DISPLAY_GAMMA = 2.2
+
+# Flat-field / dark-frame calibration (masters cached on the SD card, applied as DNG opcodes)
+CALIBRATION_DIR = ".calibration"  # relative to the raspi dir, like SESSION_JOURNAL_DIR
+CALIBRATION_FRAMES = 16  # frames averaged into each master
+CALIBRATION_GESTURE_PRESSES = 3  # LIGHT presses without film in the gate...
+CALIBRATION_GESTURE_S = 3.0  # ...within this many seconds start a calibration
+CALIBRATION_LAMP_TIMEOUT_S = 60.0
+CALIBRATION_GAIN_MAP_POINTS = (13, 17)  # vertical, horizontal
+CALIBRATION_FLAT_TARGET = 0.6  # brightest 1% of the empty gate at this share of the range above black
+CALIBRATION_METER_STEPS = 6  # exposure corrections before the flat is taken at the last one
+CALIBRATION_MAX_GAIN = 4.0  # strongest falloff correction; anything darker isn't lit gate
+CALIBRATION_MAX_CLIPPED = 1e-4  # share of the gate's pixels a flat may have clipped (hot or stuck pixels)
+RESOLUTION_RAW_SIZES = {"4K": (4056, 3040), "2K": (2028, 1520)}
+DNG_OPCODE_LIST1 = 51008  # applied to the raw values as stored
+DNG_OPCODE_LIST2 = 51009  # applied after black subtraction and scaling
+DNG_OPCODE_GAIN_MAP = 9
+DNG_OPCODE_DELTA_PER_ROW = 10
+DNG_OPCODE_DELTA_PER_COLUMN = 11
+TIFF_TYPE_UNDEFINED = 7
+
+# --- Remote preview ---
+MJPEG_DEFAULT_FPS = 5.0
+MJPEG_DEFAULT_QUALITY = 70
+MJPEG_BOUNDARY = "filmkorn-frame"
+
+# --- Review proxies ---
+PROXY_DIR = "proxies"  # inside the session dir, chunked like the frames
+PROXY_WIDTH = 512  # roughly; every n-th Bayer quad, so 507 px from both 4K and 2K raws
+PROXY_JPEG_QUALITY = 80
+PROXY_MAX_PENDING = 8  # frames waiting for the proxy process; more are skipped, never waited for
+CONTACT_SHEET_DIR = "contact-sheets"
+CONTACT_SHEET_GRID = (8, 6)  # columns, rows: 48 frames per sheet
+CONTACT_SHEET_THUMB_WIDTH = 240
+
+# --- Exposure bracketing ---
+HDR_BRACKET_STOPS = {2: (0.0, 2.0), 3: (0.0, 1.5, 3.0)}  # EV above the set shutter speed, which stays the base
+HDR_MERGE_WORKERS = 2  # processes; capture, DNG writing and lsyncd keep the other two cores
+HDR_MAX_PENDING = 4  # frames merging or waiting to be written before shoot_raw waits for them
+HDR_SETTLE_ATTEMPTS = 8  # captures to wait for a new exposure time to reach the sensor
+HDR_BLEND_DN = SENSOR_WHITE_LEVEL - 1024  # longer exposures fade out from here...
+HDR_CLIP_DN = SENSOR_WHITE_LEVEL - 64  # ...and are not used at all from here
+
+# --- Scheduling ---
+# Per role: the CPUs its threads may run on, a SCHED_FIFO priority and/or a nice value (also the
+# fallback if real-time scheduling isn't allowed). Roles a profile leaves out get its other role.
+SCHED_ROLES = ("capture", "camera", "encode", "analysis", "preview", "sync", "other")
+SCHED_PROFILES = {
+    "off": {},
+    "balanced": {  # capture gets core 3 to itself while scanning, everything else shares 0-2
+        "capture": {"cpus": [3], "fifo": 10, "nice": -10},
+        "camera": {"cpus": [2, 3], "nice": -5},
+        "encode": {"cpus": [0, 1, 2]},
+        "analysis": {"cpus": [0, 1, 2], "nice": 5},
+        "preview": {"cpus": [0, 1, 2], "nice": 10},
+        "sync": {"cpus": [0, 1, 2], "nice": 5},
+        "other": {"cpus": [0, 1, 2]},
+    },
+    "isolated": {  # capture and camera on core 3, encode and analysis on 1-2, the rest squeezed onto 0
+        "capture": {"cpus": [3], "fifo": 20, "nice": -10},
+        "camera": {"cpus": [3], "fifo": 15, "nice": -10},
+        "encode": {"cpus": [1, 2]},
+        "analysis": {"cpus": [1, 2], "nice": 5},
+        "preview": {"cpus": [0], "nice": 10},
+        "sync": {"cpus": [0]},
+        "other": {"cpus": [0]},
+    },
+}
+SCHED_PROFILES_PATH = "sched-profiles.json"  # optional extra profiles, same layout (relative to the raspi dir)
+SCHED_JITTER_SAMPLES = 4096  # frame intervals and loop wake-ups kept per scan for the jitter summary
 
 # lsyncd config switching
 LSYNCD_DIR = "/home/pi/Filmkorn-Raw-Scanner/raspi"
@@ -45,17 +206,54 @@ LSYNCD_ACTIVE_CONF = os.path.join(LSYNCD_DIR, "lsyncd.active.conf")
 LSYNCD_CONF_NET = os.path.join(LSYNCD_DIR, "lsyncd-to-host.conf")
 LSYNCD_CONF_LOCAL = os.path.join(LSYNCD_DIR, "lsyncd-local-hd.conf")
 
+# Remote mode connectivity
+SSH_IDENTITY_FILE = "/home/pi/.ssh/id_filmkorn-scanner_ed25519"
+SSH_CONTROL_PATH = "/tmp/filmkorn-ssh-%C"  # shared with lsyncd-to-host.conf
+SSH_CONTROL_PERSIST_S = 600
+NETWORK_CHECK_INTERVAL_S = 5.0
+NETWORK_WRITE_CHECK_INTERVAL_S = 30.0
+NETWORK_IDLE_INTERVAL_S = 2.0
+NETWORK_FIRST_CHECK_TIMEOUT_S = 5.0
+
+# Link bandwidth probe
+BANDWIDTH_PROBE_BYTES = 64 * 1024 * 1024
+BANDWIDTH_PROBE_CHUNK = 4 * 1024 * 1024
+BANDWIDTH_PROBE_MAX_AGE_S = 7 * 24 * 3600  # results are cached per target
+# Frame sizes until a real scan has measured them: 12-bit packed raw plus DNG header
+DEFAULT_FRAME_BYTES = {"4K": 4056 * 3040 * 3 // 2 + 65536, "2K": 2028 * 1520 * 3 // 2 + 65536}
+DNG_COMPRESSION_RATIO_ESTIMATE = 0.65  # typical LJ92 result on film scans, replaced once measured
+
 AUTO_SHUTTER_SPEED = 0  # Zero enables AE, used in Preview mode
 DISK_SPACE_WAIT_THRESHOLD = 200_000_000  # 200 MB
 DISK_SPACE_ABORT_THRESHOLD = 30_000_000  # 30 MB
 FPS_AVG_WINDOW = 0  # 0 = all frames in scan, >0 = rolling window size
 USB_POWER_CHECK_INTERVAL_S = 30.0
 USB3_CHECK_INTERVAL_S = 5.0
+USB_MOUNT_POINT = "/mnt/usb"
+
+# Thermal governor. The Pi 4 firmware soft-throttles at 80°C and hard-throttles at 85°C;
+# pacing the controller a bit earlier is much cheaper than the fps collapse of a throttled SoC.
+THERMAL_ZONE_PATH = "/sys/class/thermal/thermal_zone0/temp"
+THROTTLED_SYSFS_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+THERMAL_SAMPLE_INTERVAL_S = 1.0
+THERMAL_VCGENCMD_INTERVAL_S = 5.0  # only used if the sysfs throttle flags are missing
+THERMAL_PACE_START_C = 74.0
+THERMAL_PACE_FULL_C = 79.0
+THERMAL_LOOKAHEAD_S = 20.0  # pace on the temperature we will reach in this time at the current slope
+THERMAL_MAX_PACE_DELAY_S = 0.3
+THROTTLE_UNDERVOLTAGE = 0x1
+THROTTLE_FREQ_CAPPED = 0x2
+THROTTLE_THROTTLED = 0x4
+THROTTLE_SOFT_TEMP_LIMIT = 0x8
+NETLINK_KOBJECT_UEVENT = 15  # not exported by the socket module
 
 SHUTTER_SPEED_RANGE = 300, 500_000  # 300µs to 0.5s. This defines the range of the exposure potentiometer
 EXPOSURE_VAL_FACTOR = math.log(SHUTTER_SPEED_RANGE[1] / SHUTTER_SPEED_RANGE[0]) / 1024
 
 storage_location = None
+log_queue = queue.SimpleQueue()
+log_listener = None
+frame_log_every = 1
 current_screen = None
 ready_screen_polling = False
 camera_running = False
@@ -94,6 +292,87 @@ last_usb_speed_check = 0.0
 power_warning_active = False
 usb3_warning_active = False
 dmesg_since = None
+kmsg_monitor_running = False
+power_events = deque(maxlen=32)
+soc_temperature = None
+soc_throttled = None
+thermal_pace_delay_s = 0.0
+network_state = {"user_and_host": None, "reachable": None, "writable": None, "checked_at": 0.0, "changed_at": 0.0}
+network_state_changed = threading.Condition()
+pending_net_switch = False
+dng_compress = False
+last_link_summary = None
+bandwidth_probe_running = False
+storage_changed = threading.Condition()
+storage_generation = 0
+storage_monitor_running = False
+usb_mounted = False
+usb_block_device = None
+usb_link_speed = None
+usb_mount_requested = False
+journal_queue = queue.Queue()
+journal_writer_running = False
+resume_session = None
+frame_verify_pending = {}
+frame_verify_lock = threading.Lock()
+frame_verify_queue = queue.Queue()
+frame_verifier_running = False
+blank_frame_mode = "keep"
+exposure_stats_queue = queue.Queue(maxsize=EXPOSURE_STATS_QUEUE_SIZE)
+exposure_stats_worker_running = False
+exposure_warning = None
+weave_roi = None
+crop_to_gate = False
+scene_cuts = True
+scene_queue = queue.Queue(maxsize=SCENE_QUEUE_SIZE)
+scene_worker_running = False
+weave_queue = queue.Queue(maxsize=WEAVE_QUEUE_SIZE)
+weave_worker_running = False
+preview_analyzers = []
+exposure_assist = False
+exposure_assist_hist = None
+exposure_assist_frames = 0
+exposure_assist_key = None
+exposure_recommendation_us = None
+shown_recommendation_us = None
+focus_peaking = False
+focus_metric = None
+focus_peak = None
+focus_peaking_mask = None
+last_focus_overlay = 0.0
+negative_preview = False
+negative_luts = None
+negative_sample_frames = 0
+lamp_is_on = False
+calibration_enabled = True
+calibration_running = False
+calibration_light_presses = deque(maxlen=CALIBRATION_GESTURE_PRESSES)
+calibration_lamp_event = threading.Event()
+calibration_lamp_on = None
+calibration_opcode_cache = {}
+mjpeg_port = None
+mjpeg_fps = MJPEG_DEFAULT_FPS
+mjpeg_quality = MJPEG_DEFAULT_QUALITY
+mjpeg_clients = 0
+mjpeg_condition = threading.Condition()
+mjpeg_pending = None  # newest preview frame waiting for the encoder
+mjpeg_jpeg = None
+mjpeg_sequence = 0
+last_mjpeg_frame = 0.0
+proxies_enabled = False
+proxy_pool = None
+proxy_slots = threading.Semaphore(PROXY_MAX_PENDING)
+contact_sheet = None  # in the proxy process: (session name, first index, Image)
+hdr_brackets = 1
+hdr_pool = None
+hdr_write_queue = queue.Queue(maxsize=HDR_MAX_PENDING)
+hdr_writer_running = False
+sched_profile = "off"
+sched_roles = {}  # role -> settings of the active profile
+sched_warned = set()
+sched_frame_intervals = deque(maxlen=SCHED_JITTER_SAMPLES)
+sched_wake_latencies = deque(maxlen=SCHED_JITTER_SAMPLES)
+sched_last_frame_start = None
 update_mode = False
 update_tags = []
 update_selected = 0
@@ -109,6 +388,12 @@ current_version_label = None
 mcu_flash_in_progress = False
 mcu_flash_checked = False
 mcu_flash_error = None
+force_mcu_verify = False
+mcu_powered_at = 0.0
+startup_cache = {}
+startup_cache_lock = threading.Lock()
+startup_steps = {}
+startup_progress_key = None
 MCU_FLASH_SCRIPT = os.path.join(repo_root, "scan-controller", "bootstrap", "flash-atmega328.sh")
 MCU_HEX_PATH = os.path.join(
     repo_root,
@@ -198,6 +483,8 @@ class State:
     def __init__(self):
         self._zoom_mode = ZoomMode.Z1_1
         self.raws_path: Optional[str] = None
+        self.crop: Optional[tuple] = None
+        self.detect_crop = False
         self.raw_count = 0
         self.continue_dir = False
         self.scanning = False
@@ -206,6 +493,13 @@ class State:
         self.fps_count = 0
         self.warmup_needed = False
         self.drop_first_frame = False
+        self.max_temperature = None
+        self.throttled_frames = 0
+        self.paced_frames = 0
+        self.bytes_written = 0
+        self.frames_written = 0
+        self.blank_frames = 0
+        self.proxies = False
 
     @property
     def lamp_mode(self) -> bool:
@@ -225,9 +519,41 @@ class State:
             show_screen("target-dir-does-not-exist")
             self.stop_scan()
             return
-        self.raws_path = os.path.join(raws_path, "{:08d}.dng")
+        self.begin_session(raws_path, 0)
         logging.info(f"Set raws path to {raws_path}")
 
+    def begin_session(
+        self, raws_dir: str, next_index: int, unsynced: Optional[dict] = None, crop: Optional[list] = None
+    ):
+        self.raws_path = raws_dir
+        self.raw_count = next_index
+        self.crop = tuple(crop) if crop else None
+        self.detect_crop = crop_to_gate and self.crop is None
+        _journal_open(raws_dir, next_index, unsynced)
+
+    def frame_path(self, index: int) -> str:
+        return os.path.join(self.raws_path, _frame_relpath(index))
+
+    def resume_interrupted_session(self) -> bool:
+        global resume_session
+        session, resume_session = resume_session, None
+        if session is None:
+            return False
+        if not session["dir"].endswith(_resolution_suffix()):
+            logging.info("journal: resolution changed, not resuming %s", os.path.basename(session["dir"]))
+            _abandon_session(session, "resolution-changed")
+            return False
+        try:
+            os.makedirs(session["dir"], exist_ok=True)
+        except OSError as exc:
+            logging.error("Failed to recreate RAWs path %s: %s", session["dir"], exc)
+            return False
+        self.begin_session(session["dir"], session["next_index"], session["unsynced"], session["crop"])
+        if session["frames"]:
+            self.detect_crop = False  # keep the frame size the session started with
+        logging.info("Resuming %s at frame %d", session["dir"], session["next_index"])
+        return True
+
     def start_scan(self, arg_bytes=None):
         if self.continue_dir:
             return
@@ -238,24 +564,57 @@ class State:
             self.fps_history.clear()
         self.fps_sum = 0.0
         self.fps_count = 0
-        global last_fps_value, last_shutter_value
+        self.max_temperature = None
+        self.throttled_frames = 0
+        self.paced_frames = 0
+        self.bytes_written = 0
+        self.frames_written = 0
+        self.blank_frames = 0
+        self.proxies = proxies_enabled
+        if proxies_enabled:
+            _start_proxy_renderer()  # again, if the last session's renderer failed
+        global last_fps_value, last_shutter_value, exposure_warning
         last_fps_value = None
         last_shutter_value = None
+        exposure_warning = None
         global sleep_mode
         sleep_mode = False
         self.warmup_needed = True
         self.drop_first_frame = True
         set_zoom_mode_1_1()
         set_lamp_on()
-        self.set_raws_path()
+        if not self.resume_interrupted_session():
+            self.set_raws_path()
         logging.info("Started scanning")
         sleep(1.0)  # allow lamp to reach full brightness
+        _reset_sched_jitter()
+        _pin_lsyncd()
+        _apply_sched_role("capture")
         say_ready()
 
     def stop_scan(self, arg_bytes=None):
         self.continue_dir = False
         self.scanning = False
+        _apply_sched_role("other")
         logging.info("Scanning stopped")
+        _wait_for_hdr_merges()  # their frame records belong before the end record
+        _finish_proxies()
+        exposure_stats_queue.join()  # the last frames' stats, for the exposure sidecar
+        scene_queue.join()  # the last cuts, for scenes.edl
+        weave_queue.join()  # the last offsets, for gate-weave.csv
+        _journal_append({"type": "end", "frames": self.raw_count})
+        _reset_negative_preview()
+        if self.blank_frames:
+            logging.info("blank frames: %d flagged (%s)", self.blank_frames, blank_frame_mode)
+        if self.max_temperature is not None:
+            logging.info(
+                "thermal: scan peaked at %.1f°C, %d frames throttled, %d frames paced",
+                self.max_temperature,
+                self.throttled_frames,
+                self.paced_frames,
+            )
+        _record_scan_profile()
+        _log_sched_jitter()
         set_lamp_off()
         tell_arduino(Command.TELL_LOADSTATE)
         try:
@@ -850,7 +1209,7 @@ def _draw_text_badge(base_img, text: str, position: str):
         x = max(0, preview_size[0] - text_w - margin)
     else:
         x = margin
-    if position == "top-right":
+    if position in ("top-right", "top-left"):
         y = margin
     else:
         y = max(0, preview_size[1] - text_h - margin)
@@ -898,10 +1257,21 @@ def _render_scan_overlay():
         base_img = Image.fromarray(base_overlay.copy(), "RGBA")
     else:
         base_img = Image.new("RGBA", preview_size, (0, 0, 0, 0))
+    focus_active = state.zoom_mode != ZoomMode.Z1_1 and not state.scanning and focus_metric is not None
+    mask = focus_peaking_mask
+    if focus_active and mask is not None and mask.shape == (preview_size[1], preview_size[0]):
+        pixels = np.array(base_img, dtype=np.uint8)
+        pixels[mask] = FOCUS_PEAKING_COLOR
+        base_img = Image.fromarray(pixels, "RGBA")
+    if focus_active:
+        _draw_text_badge(base_img, f"Focus {focus_metric:.0f}  peak {focus_peak:.0f}", "top-left")
     if last_fps_value is not None and state.scanning:
         _draw_text_badge(base_img, f"{last_fps_value:.1f} fps", "bottom-left")
     if last_shutter_value is not None and show_shutter:
-        _draw_text_badge(base_img, _format_shutter_speed(last_shutter_value), "bottom-right")
+        shutter_text = _format_shutter_speed(last_shutter_value)
+        if exposure_recommendation_us is not None and not state.scanning:
+            shutter_text += f"  (assist {_format_exposure_recommendation(last_shutter_value)})"
+        _draw_text_badge(base_img, shutter_text, "bottom-right")
     if (
         current_screen in STATUS_SCREENS
         and current_screen != "target-dir-does-not-exist"
@@ -910,6 +1280,10 @@ def _render_scan_overlay():
         _draw_text_badge(base_img, last_resolution_label, "bottom-center")
     if current_screen in STATUS_SCREENS and current_version_label:
         _draw_text_badge(base_img, current_version_label, "top-right")
+    if show_shutter and not state.scanning and last_link_summary:
+        _draw_text_badge(base_img, last_link_summary, "top-left")
+    if state.scanning and exposure_warning:
+        _draw_text_badge(base_img, exposure_warning, "top-left")
     pending_overlay = np.array(base_img, dtype=np.uint8)
     _apply_overlay_if_ready()
 
@@ -1124,31 +1498,36 @@ def showInsertFilm(arg_bytes=None):
     logging.info("Showing Screen: Please insert film")
     global ready_to_scan
     ready_to_scan = False
+    _reset_negative_preview()
     show_screen("insert-film")
 
 def showReadyToScan(arg_bytes=None):
     logging.info("Showing Screen: Ready to Scan")
     global ready_to_scan
     ready_to_scan = True
+    _reset_negative_preview()  # new film in the gate
     show_ready_to_scan()
 
 def _ready_screen_poll_loop():
     global ready_screen_polling, storage_location
     ready_screen_polling = True
+    generation = storage_generation
     try:
         while (ready_to_scan or current_screen == "no-drive-connected") and not shutting_down:
             if sleep_mode:
                 sleep(1)
                 continue
-            if storage_location == 1 and not os.path.ismount("/mnt/usb"):
-                _ensure_usb_mount()
+            if storage_location == 1 and not _usb_is_mounted():
+                _request_usb_mount()
+                if current_screen == "ready-to-scan-local" and not shutting_down:
+                    show_ready_to_scan()
             new_storage_location = GPIO.input(5)
             if new_storage_location != storage_location:
                 storage_location = new_storage_location
                 logging.info(
                     f"GPIO 5 changed while ready (1=HDD/local, 0=Net/remote): {storage_location}"
                 )
-                if storage_location == 1 and not os.path.ismount("/mnt/usb"):
+                if storage_location == 1 and not _usb_is_mounted():
                     if not shutting_down:
                         if current_screen != "no-drive-connected":
                             show_screen("no-drive-connected")
@@ -1161,12 +1540,13 @@ def _ready_screen_poll_loop():
             if (
                 storage_location == 1
                 and current_screen == "no-drive-connected"
-                and os.path.ismount("/mnt/usb")
+                and _usb_is_mounted()
             ):
                 switch_lsyncd_config(storage_location)
                 if not shutting_down:
                     show_ready_to_scan()
-            sleep(1)
+            # Storage changes wake us up right away; the timeout keeps polling the GPIO 5 switch.
+            generation = _wait_for_storage_change(generation, 1.0)
     finally:
         ready_screen_polling = False
 
@@ -1213,7 +1593,7 @@ def _ramdisk_empty_poll_loop():
 
 def show_ready_to_scan():
     global ready_to_scan
-    if storage_location == 1 and not os.path.ismount("/mnt/usb"):
+    if storage_location == 1 and not _usb_is_mounted():
         ready_to_scan = False
         show_screen("no-drive-connected")
         if not ready_screen_polling:
@@ -1221,12 +1601,14 @@ def show_ready_to_scan():
         return
     ready_to_scan = True
     if storage_location == 1:
-        _ensure_usb_mount()
         screen = "ready-to-scan-local"
     elif storage_location == 0:
         screen = "ready-to-scan-net"
+        if network_state["checked_at"] > 0.0 and not _network_target_ready():
+            screen = _network_problem_screen()
     else:
         screen = "ready-to-scan"
+    _maybe_probe_bandwidth()
     show_screen(screen)
     if last_shutter_value is not None:
         update_shutter_overlay(last_shutter_value)
@@ -1356,6 +1738,7 @@ def clear_pid_file(_signum=None, _frame=None):
 
 def _force_exit():
     logging.error("Shutdown timed out; forcing exit")
+    _stop_logging()
     os._exit(0)
 
 def _start_shutdown_timer(timeout_s: float = 5.0):
@@ -1366,6 +1749,10 @@ def _start_shutdown_timer(timeout_s: float = 5.0):
     shutdown_timer.daemon = True
     shutdown_timer.start()
 
+def _frame_relpath(index: int) -> str:
+    # Numbering stays continuous across chunks: 0000/00000000.dng ... 0001/00001000.dng
+    return os.path.join("{:04d}".format(index // SESSION_CHUNK_FRAMES), "{:08d}.dng".format(index))
+
 def datetime_to_raws_path(dt: datetime):
     return RAW_DIRS_PATH + dt.strftime("%Y-%m-%d at %H_%M_%S")
 
@@ -1374,240 +1761,2311 @@ def _resolution_suffix() -> str:
         return " @2K"
     return " @4K"
 
-def remove_empty_dirs():
-    for file_name in os.listdir(RAW_DIRS_PATH):
-        file_path = RAW_DIRS_PATH + file_name
-        if os.path.isdir(file_path) and len(os.listdir(file_path)) == 0:
-            os.rmdir(file_path)
-
+def _partial_frame_path(frame_path: str) -> str:
+    # Hidden name in the same dir: lsyncd excludes dotfiles, and pidng insists on the .dng suffix.
+    head, tail = os.path.split(frame_path)
+    return os.path.join(head, "." + tail)
 
-# --- lsyncd config switching helpers ---
-def _atomic_symlink(target: str, link_path: str) -> None:
-    """Atomically replace link_path with a symlink to target."""
-    tmp_path = link_path + ".tmp"
+def _save_frame(write_dng: Callable[[str], None], frame_path: str, extra_tags: Optional[dict] = None) -> None:
+    """Write the frame under a hidden name and rename it into place, so lsyncd never sees half a DNG."""
+    partial_path = _partial_frame_path(frame_path)
+    os.makedirs(os.path.dirname(frame_path), exist_ok=True)  # next chunk
     try:
-        if os.path.islink(tmp_path) or os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-    except FileNotFoundError:
-        pass
-    os.symlink(target, tmp_path)
-    os.replace(tmp_path, link_path)
+        write_dng(partial_path)
+        if extra_tags:
+            _append_dng_tags(partial_path, extra_tags)
+        os.rename(partial_path, frame_path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
 
-def _get_mount_device(mount_point: str) -> Optional[str]:
+def remove_empty_dirs():
+    # Bottom-up, so emptied chunk dirs take their session dir with them.
+    for dir_path, dir_names, file_names in os.walk(RAW_DIRS_PATH, topdown=False):
+        if os.path.normpath(dir_path) == os.path.normpath(RAW_DIRS_PATH):
+            continue
+        for leftover in file_names:
+            if leftover.startswith(".") and leftover.endswith(".dng"):
+                os.remove(os.path.join(dir_path, leftover))  # interrupted write, never published
+        if len(os.listdir(dir_path)) == 0:
+            os.rmdir(dir_path)
+
+
+# --- session journal ---
+# One append-only JSON-lines file per session:
+#   {"type": "open", ...}    session dir, resolution and first frame index (again on every resume)
+#   {"type": "frame", ...}   index, size and hash of a saved frame
+#   {"type": "crop", ...}    the gate rectangle frames of this session are cut down to
+#   {"type": "cut", ...}     first frame of a new scene
+#   {"type": "weave", ...}   offset of a frame against an earlier one (ref), in sensor pixels
+#   {"type": "synced", ...}  indices lsyncd has moved off the ramdisk
+#   {"type": "end", ...}     written on a regular stop; a journal without it belongs to an interrupted session
+def _journal_path(session_dir: str) -> str:
+    return os.path.join(SESSION_JOURNAL_DIR, os.path.basename(os.path.normpath(session_dir)) + ".jsonl")
+
+def _new_frame_hash():
+    if xxhash is not None:
+        return xxhash.xxh3_64()
+    return hashlib.blake2b(digest_size=16)
+
+def _frame_digest(path: str, from_media: bool = False) -> Optional[str]:
+    digest = _new_frame_hash()
     try:
-        with open("/proc/mounts", "r") as file:
-            for line in file:
-                parts = line.split()
-                if len(parts) >= 2 and parts[1] == mount_point:
-                    return parts[0]
-    except Exception:
-        return None
-    return None
-
-def _get_block_device_name(device_path: str) -> Optional[str]:
-    if not device_path.startswith("/dev/"):
-        return None
-    name = os.path.basename(device_path)
-    if name.startswith("nvme") or name.startswith("mmcblk"):
-        return re.sub(r"p\d+$", "", name)
-    return re.sub(r"\d+$", "", name)
-
-def _find_usb_speed(block_device: str) -> Optional[float]:
-    sys_path = os.path.realpath(os.path.join("/sys/class/block", block_device))
-    current = sys_path
+        with open(path, "rb") as handle:
+            if from_media:
+                # Freshly copied pages are still in the page cache; write them out and drop them so
+                # the read really comes back from the USB drive.
+                os.fsync(handle.fileno())
+                os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None  # already shipped by lsyncd
+    return digest.hexdigest()
+
+def _fsync_journal(handle) -> None:
+    handle.flush()
+    os.fsync(handle.fileno())
+
+def _journal_writer_loop() -> None:
+    _apply_sched_role("analysis")
+    handle = None
+    unsynced = {}
+    dirty = 0
+    last_fsync = time.monotonic()
+    last_sync_check = 0.0
     while True:
-        speed_path = os.path.join(current, "speed")
-        if os.path.isfile(speed_path):
-            try:
-                with open(speed_path, "r") as file:
-                    return float(file.read().strip())
-            except Exception:
-                return None
-        parent = os.path.dirname(current)
-        if parent == current:
-            break
-        current = parent
-    return None
+        try:
+            record = journal_queue.get(timeout=SESSION_JOURNAL_SYNC_CHECK_S)
+        except queue.Empty:
+            record = None
+        try:
+            kind = record.pop("type") if record is not None else None
+            if kind == "open":
+                if handle is not None:
+                    handle.close()
+                os.makedirs(SESSION_JOURNAL_DIR, exist_ok=True)
+                journal_path = record.pop("journal")
+                handle = open(journal_path, "a", encoding="utf-8")
+                unsynced = record.pop("unsynced", None) or {}
+            elif kind == "frame":
+                frame_path = record.pop("path", None)
+                record["hash"] = _frame_digest(frame_path) if frame_path else None
+                if frame_path:
+                    unsynced[record["index"]] = frame_path
+                if record["hash"] is not None:
+                    _enqueue_frame_verification(frame_path, record["hash"])
+            elif kind == "flush":
+                if handle is not None and dirty:
+                    _fsync_journal(handle)
+                    dirty = 0
+                record["done"].set()
+                continue
+            if kind is not None and handle is not None:
+                handle.write(json.dumps({"type": kind, **record}) + "\n")
+                dirty += 1
+            if kind == "end" and handle is not None:
+                _fsync_journal(handle)
+                handle.close()
+                handle = None
+                unsynced = {}
+                dirty = 0
+                _write_session_sidecars(journal_path)
+                _prune_journals()
+                continue
+            if handle is None:
+                continue
 
-def _dmesg_power_warning() -> Optional[str]:
-    args = ["dmesg"]
-    if dmesg_since:
-        args.extend(["--since", dmesg_since])
-    result = subprocess.run(
-        args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        text=True,
-    )
-    if result.returncode != 0:
-        return None
-    for line in result.stdout.splitlines():
-        lower = line.lower()
-        if "over-current" in lower:
-            return line.strip()
-        if "undervoltage" in lower or "under-voltage" in lower:
-            return line.strip()
-        if "insufficient power" in lower:
-            return line.strip()
-    return None
+            now = time.monotonic()
+            if unsynced and now - last_sync_check >= SESSION_JOURNAL_SYNC_CHECK_S:
+                last_sync_check = now
+                shipped = sorted(index for index, path in unsynced.items() if not os.path.exists(path))
+                if shipped:
+                    for index in shipped:
+                        del unsynced[index]
+                    handle.write(json.dumps({"type": "synced", "indices": shipped}) + "\n")
+                    dirty += 1
+            if dirty and (dirty >= SESSION_JOURNAL_FSYNC_FRAMES or now - last_fsync >= SESSION_JOURNAL_FSYNC_S):
+                _fsync_journal(handle)
+                dirty = 0
+                last_fsync = now
+        except Exception as exc:
+            logging.warning("journal: failed to write %s record: %s", kind, exc)
 
-def _check_usb_power_warning() -> None:
-    global last_usb_power_check, usb_power_warning_logged, power_warning_active
-    now = time.monotonic()
-    if now - last_usb_power_check < USB_POWER_CHECK_INTERVAL_S:
+def _start_journal_writer() -> None:
+    global journal_writer_running
+    if journal_writer_running:
         return
-    last_usb_power_check = now
-    warning_line = _dmesg_power_warning()
-    if not usb_power_warning_logged and warning_line:
-        logging.warning("Detected USB power warning in dmesg: %s", warning_line)
-        usb_power_warning_logged = True
-        power_warning_active = True
-    if power_warning_active and not sleep_mode:
-        if state.scanning:
-            state.stop_scan()
-        if current_screen != "too-much-power":
-            show_screen("too-much-power")
+    journal_writer_running = True
+    threading.Thread(target=_journal_writer_loop, daemon=True).start()
 
-def _check_usb3_speed_warning() -> None:
-    global last_usb_speed_check, usb_speed_warning_logged, usb3_warning_active
-    now = time.monotonic()
-    if now - last_usb_speed_check < USB3_CHECK_INTERVAL_S:
-        return
-    last_usb_speed_check = now
-    if not os.path.ismount("/mnt/usb"):
-        return
-    mount_device = _get_mount_device("/mnt/usb")
-    if not mount_device:
+def _journal_append(record: dict) -> None:
+    _start_journal_writer()
+    journal_queue.put(record)
+
+def _journal_flush(timeout_s: float = 2.0) -> None:
+    if not journal_writer_running:
         return
-    block_device = _get_block_device_name(mount_device)
-    if not block_device:
+    done = threading.Event()
+    journal_queue.put({"type": "flush", "done": done})
+    done.wait(timeout_s)
+
+def _journal_open(session_dir: str, first_index: int, unsynced: Optional[dict] = None) -> None:
+    _journal_append({
+        "type": "open",
+        "journal": _journal_path(session_dir),
+        "unsynced": dict(unsynced or {}),
+        "dir": session_dir,
+        "resolution": _resolution_suffix().strip(" @"),
+        "hash": FRAME_HASH_NAME,
+        "first_index": first_index,
+        "at": datetime.now().isoformat(timespec="seconds"),
+    })
+
+def _publish_session_file(session_dir: str, name: str, data: bytes) -> None:
+    tmp_path = os.path.join(session_dir, "." + name)
+    try:
+        os.makedirs(session_dir, exist_ok=True)
+        with open(tmp_path, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp_path, os.path.join(session_dir, name))
+    except OSError as exc:
+        logging.warning("journal: failed to write %s for %s: %s", name, session_dir, exc)
         return
-    speed = _find_usb_speed(block_device)
-    if speed is None:
+    _enqueue_frame_verification(os.path.join(session_dir, name))
+
+def _write_session_sidecars(journal_path: str) -> None:
+    """Build the per-session sidecars from the journal and drop them into the session dir, so they
+    ship along with the frames and survive a resumed session."""
+    journal = _read_journal(journal_path)
+    if journal is None:
         return
-    if speed >= 1000.0:
-        usb_speed_warning_logged = False
-        if usb3_warning_active:
-            usb3_warning_active = False
-            if current_screen == "no-usb3-drive":
-                if last_status_screen:
-                    show_screen(last_status_screen)
-                else:
-                    show_ready_to_scan()
+    session_dir = journal["session"]["dir"]
+    frames = sorted(journal["frames"].items())
+
+    algo = journal["session"].get("hash", FRAME_HASH_NAME)
+    lines = [
+        "{}  {}\n".format(frame["hash"], _frame_relpath(index))
+        for index, frame in frames
+        if frame.get("hash")
+    ]
+    if lines:
+        _publish_session_file(session_dir, "frames." + algo, "".join(lines).encode())
+
+    blank = ["{},{},{}\n".format(index, frame["blank"], "written" if frame.get("size") else blank_frame_mode)
+             for index, frame in frames if frame.get("blank")]
+    if blank:
+        _publish_session_file(session_dir, "blank-frames.csv", ("index,kind,action\n" + "".join(blank)).encode())
+
+    stats = journal["stats"]
+    if stats:
+        # Columnar: one array per channel and field, e.g. np.load(...)["G_p99"]
+        indices = sorted(stats)
+        columns = {"index": np.array(indices, dtype=np.int32)}
+        for channel in "RGB":
+            for position, field in enumerate(EXPOSURE_STATS_FIELDS):
+                columns[f"{channel}_{field}"] = np.array(
+                    [stats[index][channel][position] for index in indices], dtype=np.float32
+                )
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **columns)
+        _publish_session_file(session_dir, "exposure-stats.npz", buffer.getvalue())
+
+    weave = journal["weave"]
+    if weave:
+        # x/y accumulate along the ref chain: shift each frame by -x/-y to register it on the first one.
+        positions = {}
+        lines = []
+        for index in sorted(weave):
+            record = weave[index]
+            x, y = positions.get(record["ref"], (0.0, 0.0))
+            positions[index] = x + record["dx"], y + record["dy"]
+            lines.append("{},{},{},{},{:.2f},{:.2f},{}\n".format(
+                index, record["ref"], record["dx"], record["dy"], *positions[index], record["peak"]
+            ))
+        _publish_session_file(session_dir, "gate-weave.csv", ("index,ref,dx,dy,x,y,peak\n" + "".join(lines)).encode())
+
+    stored = [index for index, frame in frames if frame.get("size")]
+    if stored and (journal["cuts"] or scene_cuts):
+        edls = _scene_edl(os.path.basename(os.path.normpath(session_dir)), stored, journal["cuts"])
+        for part, edl in enumerate(edls, 1):
+            _publish_session_file(session_dir, "scenes.edl" if part == 1 else f"scenes-{part}.edl", edl.encode())
+
+def _prune_journals() -> None:
+    try:
+        names = sorted(name for name in os.listdir(SESSION_JOURNAL_DIR) if name.endswith(".jsonl"))
+    except OSError:
         return
-    if not usb_speed_warning_logged:
-        logging.warning(
-            "USB drive at /mnt/usb is running at %.0fMbit/s (USB3 is 5000M).",
-            speed,
-        )
-        usb_speed_warning_logged = True
-    usb3_warning_active = True
-    if not sleep_mode and not power_warning_active:
-        show_screen("no-usb3-drive")
+    for name in names[:-SESSION_JOURNAL_KEEP]:
+        try:
+            os.remove(os.path.join(SESSION_JOURNAL_DIR, name))
+        except OSError:
+            pass
 
-def _read_user_and_host() -> Optional[str]:
+def _read_journal(path: str) -> Optional[dict]:
+    session = None
+    frames = {}
+    stats = {}
+    weave = {}
+    cuts = {}
+    crop = None
+    synced = set()
+    ended = False
     try:
-        with open(".user_and_host", "r") as file:
-            return file.read().strip()
-    except Exception:
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn last line from the power loss
+                kind = record.get("type")
+                if kind == "open":
+                    session = session or record
+                    ended = False
+                elif kind == "frame":
+                    frames[record["index"]] = record
+                elif kind == "stats":
+                    stats[record["index"]] = record
+                elif kind == "weave":
+                    weave[record["index"]] = record
+                elif kind == "cut":
+                    cuts[record["index"]] = record
+                elif kind == "crop":
+                    crop = record.get("rect")
+                elif kind == "synced":
+                    synced.update(record.get("indices", []))
+                elif kind == "end":
+                    ended = True
+    except OSError as exc:
+        logging.warning("journal: failed to read %s: %s", path, exc)
         return None
+    if session is None:
+        return None
+    return {
+        "session": session,
+        "frames": frames,
+        "stats": stats,
+        "weave": weave,
+        "cuts": cuts,
+        "crop": crop,
+        "synced": synced,
+        "ended": ended,
+        "journal": path,
+    }
 
-def _read_scan_destination() -> Optional[str]:
+def _find_interrupted_session() -> Optional[dict]:
+    """Return resume info for the newest session that never saw a regular stop."""
     try:
-        with open(".scan_destination", "r") as file:
-            return file.read().strip()
-    except Exception:
+        names = sorted(name for name in os.listdir(SESSION_JOURNAL_DIR) if name.endswith(".jsonl"))
+    except OSError:
+        return None
+    if not names:
+        return None
+    journal = _read_journal(os.path.join(SESSION_JOURNAL_DIR, names[-1]))
+    if journal is None or journal["ended"]:
         return None
 
-def _read_host_path() -> Optional[str]:
+    session_dir = journal["session"]["dir"]
+    frames = journal["frames"]
+    next_index = max(frames) + 1 if frames else journal["session"].get("first_index", 0)
+    unsynced = {}
+    unconfirmed = 0
+    written = set(index for index, frame in frames.items() if frame.get("size") != 0)
+    for index in sorted(written - journal["synced"]):
+        frame_path = os.path.join(session_dir, _frame_relpath(index))
+        if os.path.exists(frame_path):
+            unsynced[index] = frame_path
+        else:
+            unconfirmed += 1
+    logging.info(
+        "journal: %s was interrupted after %d frames; next scan resumes at frame %d",
+        os.path.basename(session_dir),
+        len(frames),
+        next_index,
+    )
+    if unconfirmed:
+        logging.info(
+            "journal: %d frames left the ramdisk before their sync was journaled (assumed shipped)",
+            unconfirmed,
+        )
+    hashes = {path: frames[index].get("hash") for index, path in unsynced.items()}
+    return {
+        "dir": session_dir,
+        "next_index": next_index,
+        "unsynced": unsynced,
+        "hashes": hashes,
+        "crop": journal["crop"],
+        "frames": len(frames),
+        "journal": journal["journal"],
+    }
+
+def _reship_unsynced_frames(session: dict) -> None:
+    # lsyncd's startup sync picks these up anyway; touching them makes sure an already running lsyncd does too.
+    for frame_path in session["unsynced"].values():
+        try:
+            os.utime(frame_path)
+        except OSError:
+            continue
+        _enqueue_frame_verification(frame_path, session["hashes"].get(frame_path))
+    if session["unsynced"]:
+        logging.info("journal: re-shipping %d unsynced frames from the ramdisk", len(session["unsynced"]))
+
+def _abandon_session(session: dict, reason: str) -> None:
     try:
-        with open(".host_path", "r") as file:
-            return file.read().strip()
-    except Exception:
+        with open(session["journal"], "a", encoding="utf-8") as handle:
+            handle.write(json.dumps({"type": "end", "reason": reason}) + "\n")
+            _fsync_journal(handle)
+    except OSError as exc:
+        logging.warning("journal: failed to close %s: %s", session["journal"], exc)
+
+
+# --- raw frame analysis ---
+def _raw_black_level(metadata: dict) -> float:
+    levels = metadata.get("SensorBlackLevels")
+    if not levels:
+        return 256.0  # IMX477 default at 12 bit
+    return sum(levels) / len(levels) / (1 << (16 - SENSOR_BIT_DEPTH))
+
+def _csi2p_groups(packed: np.ndarray, config: dict) -> np.ndarray:
+    """View a 12-bit CSI2P buffer as (height, width / 2, 3): two pixels in three bytes, MSBs first,
+    both LSB nibbles in the third byte."""
+    width, height = config["size"]
+    stride = config["stride"]
+    if packed.ndim == 1 or packed.shape[-1] != stride:
+        packed = packed.reshape(-1)[: height * stride].reshape(height, stride)
+    return packed[:, : (width // 2) * 3].reshape(height, width // 2, 3)
+
+def _raw_bayer_planes(request, step: int, channels: str = "RGB") -> dict:
+    """Unpack every `step`-th Bayer quad of the CSI2P raw buffer into flat 12-bit planes per channel.
+
+    Works on a zero-copy mapping of the buffer; only the sampled bytes are touched and copied.
+    """
+    config = request.config["raw"]
+    order = config["format"][1:5]  # "SBGGR12_CSI2P" -> "BGGR"; the transform can change it
+    with MappedArray(request, "raw") as mapped:
+        groups = _csi2p_groups(mapped.array, config)
+        rows = (groups[0::2 * step, ::step], groups[1::2 * step, ::step])
+        planes = {}
+        for row_index, quads in enumerate(rows):
+            low = None
+            for column in (0, 1):
+                channel = order[row_index * 2 + column]
+                if channel not in channels:
+                    continue
+                if low is None:
+                    low = quads[..., 2]
+                high = quads[..., column].astype(np.uint16) << 4
+                value = high | (low & 0xF if column == 0 else low >> 4)
+                planes.setdefault(channel, []).append(value)
+    return {channel: np.concatenate(values, axis=None) for channel, values in planes.items()}
+
+def _classify_blank_frame(planes: dict, black: float) -> Optional[str]:
+    """Return "black", "clear" or "uniform" for a near-featureless frame, None for picture content."""
+    green = planes["G"].astype(np.float32)
+    if green.std() >= BLANK_FRAME_MAX_STD:
         return None
+    level = float(green.mean()) - black
+    if level <= BLANK_FRAME_BLACK_DN:
+        return "black"
+    if level >= (SENSOR_WHITE_LEVEL - black) * BLANK_FRAME_CLEAR_FRACTION:
+        return "clear"
+    return "uniform"
+
+def _blank_placeholder_path(frame_path: str) -> str:
+    return os.path.splitext(frame_path)[0] + ".blank"
+
+def _exposure_stats(planes: dict, black: float) -> dict:
+    stats = {}
+    for channel in "RGB":
+        values = planes[channel]
+        p01, p50, p99 = np.percentile(values, (1, 50, 99))
+        stats[channel] = [
+            round(float(values.mean()), 1),
+            round(float(p01), 1),
+            round(float(p50), 1),
+            round(float(p99), 1),
+            round(float(np.count_nonzero(values >= EXPOSURE_CLIP_DN)) / values.size, 5),
+            round(float(np.count_nonzero(values <= black + EXPOSURE_CRUSH_DN)) / values.size, 5),
+        ]
+    return stats
 
-def _verify_mcu_firmware() -> bool:
-    global mcu_flash_checked, mcu_flash_error
-    if mcu_flash_checked:
-        return False
-    mcu_flash_checked = True
-    logging.info("mcu: starting firmware verify")
-    if not os.path.isfile(MCU_HEX_PATH):
-        mcu_flash_error = f"missing hex: {MCU_HEX_PATH}"
-        logging.error("mcu: %s", mcu_flash_error)
-        return False
-    if not os.path.isfile(MCU_AVRDUDE_CONF):
-        mcu_flash_error = f"missing avrdude config: {MCU_AVRDUDE_CONF}"
-        logging.error("mcu: %s", mcu_flash_error)
-        return False
-    if not os.path.isfile(MCU_AVRDUDE):
-        mcu_flash_error = f"missing avrdude: {MCU_AVRDUDE}"
-        logging.error("mcu: %s", mcu_flash_error)
-        return False
-    result = subprocess.run(
-        [
-            MCU_AVRDUDE,
-            "-C",
-            MCU_AVRDUDE_CONF,
-            "-p",
-            "atmega328p",
-            "-c",
-            "raspberry_pi_gpio",
-            "-P",
-            "gpiochip0",
-            "-U",
-            f"flash:v:{MCU_HEX_PATH}:i",
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    if result.returncode == 0:
-        logging.info("mcu: firmware already matches expected hex")
-        return False
-    else:
-        logging.warning("mcu: firmware mismatch detected (code=%s)", result.returncode)
-        if result.stderr:
-            logging.info("mcu: verify stderr: %s", result.stderr.strip())
-        return True
+def _format_exposure_warning(stats: dict) -> Optional[str]:
+    clipped = {channel: values[EXPOSURE_STATS_FIELDS.index("clipped")] for channel, values in stats.items()}
+    worst = max(clipped, key=clipped.get)
+    if clipped[worst] < EXPOSURE_CLIP_WARN_FRACTION:
+        return None
+    return f"{worst} clips {clipped[worst] * 100:.1f}%"
 
-def _run_mcu_flash_if_needed():
-    global mcu_flash_in_progress, mcu_flash_error
-    if mcu_flash_in_progress:
+def _exposure_stats_worker() -> None:
+    global exposure_warning
+    _apply_sched_role("analysis")
+    while True:
+        index, planes, black = exposure_stats_queue.get()
+        try:
+            stats = _exposure_stats(planes, black)
+            # The overlay picks this up with the next frame, from the main thread.
+            exposure_warning = _format_exposure_warning(stats)
+            _journal_append({"type": "stats", "index": index, **stats})
+        except Exception as exc:
+            logging.warning("exposure stats failed for frame %d: %s", index, exc)
+        finally:
+            exposure_stats_queue.task_done()
+
+def _queue_exposure_stats(index: int, planes: dict, black: float) -> None:
+    global exposure_stats_worker_running
+    if not exposure_stats_worker_running:
+        exposure_stats_worker_running = True
+        threading.Thread(target=_exposure_stats_worker, daemon=True).start()
+    try:
+        exposure_stats_queue.put_nowait((index, planes, black))
+    except queue.Full:
+        logging.debug("exposure stats: worker behind, skipping frame %d", index)
+
+
+# --- gate weave ---
+# Each frame's offset against the previous one, from phase correlation of a decimated green image of
+# the perforation side. The perforation edge moves with the film, the picture content doesn't matter.
+def _parse_weave_roi(text: str) -> tuple:
+    x, y, width, height = (float(value) for value in text.split(","))
+    if not (0.0 <= x < 1.0 and 0.0 <= y < 1.0 and 0.0 < width <= 1.0 - x and 0.0 < height <= 1.0 - y):
+        raise argparse.ArgumentTypeError(f"not a region inside the frame: {text}")
+    return x, y, width, height
+
+def _raw_green_roi(request, roi: tuple, step: int) -> np.ndarray:
+    """The 8 MSBs of one green pixel of every `step`-th Bayer quad inside `roi`, as a 2-D array."""
+    config = request.config["raw"]
+    width, height = config["size"]
+    column = config["format"][1:3].index("G")  # the green pixel of the first Bayer row
+    x, y, roi_width, roi_height = roi
+    quads_x, quads_y = width // 2, height // 2
+    with MappedArray(request, "raw") as mapped:
+        groups = _csi2p_groups(mapped.array, config)
+        return groups[
+            int(quads_y * y) * 2 : int(quads_y * (y + roi_height)) * 2 : 2 * step,
+            int(quads_x * x) : int(quads_x * (x + roi_width)) : step,
+            column,
+        ].copy()
+
+def _weave_spectrum(sample: np.ndarray) -> np.ndarray:
+    image = sample.astype(np.float32)
+    image -= image.mean()
+    image *= np.outer(np.hanning(image.shape[0]), np.hanning(image.shape[1])).astype(np.float32)
+    return np.fft.rfft2(image)
+
+def _phase_correlate(reference: np.ndarray, spectrum: np.ndarray, shape: tuple) -> tuple:
+    """(dy, dx, peak) of the image behind `spectrum` against the one behind `reference`, in samples.
+
+    peak is 1.0 for a perfect match and drops towards 0 as the two stop looking alike.
+    """
+    cross = spectrum * np.conj(reference)
+    cross /= np.maximum(np.abs(cross), 1e-6)
+    # Film grain fills the high frequencies with noise; a Gaussian low-pass turns the peak into a
+    # Gaussian too, which both survives the grain and has an exact sub-sample fit.
+    frequencies_y = np.fft.fftfreq(shape[0])[:, None]
+    frequencies_x = np.fft.rfftfreq(shape[1])[None, :]
+    weights = np.exp(-(frequencies_y ** 2 + frequencies_x ** 2) / (2 * WEAVE_BANDWIDTH ** 2))
+    cross *= weights
+    # What the peak would be for two identical images: the half spectrum counts twice, except column 0.
+    perfect = (weights[:, 0].sum() + 2 * weights[:, 1:].sum()) / (shape[0] * shape[1])
+    surface = np.fft.irfft2(cross, s=shape)
+    peak = np.unravel_index(int(np.argmax(surface)), shape)
+    center = surface[peak]
+    offsets = []
+    for axis, size in enumerate(shape):
+        neighbours = []
+        for step in (-1, 1):
+            position = list(peak)
+            position[axis] = (position[axis] + step) % size
+            neighbours.append(surface[tuple(position)])
+        before, after = neighbours
+        fraction = 0.0
+        if before > 0 and after > 0 and center > 0:
+            curvature = np.log(before) - 2 * np.log(center) + np.log(after)
+            if curvature < 0:
+                fraction = 0.5 * (np.log(before) - np.log(after)) / curvature
+        offset = peak[axis] + fraction
+        offsets.append(float(offset - size if offset > size / 2 else offset))
+    return offsets[0], offsets[1], float(center / perfect)
+
+def _weave_worker() -> None:
+    # Strictly in frame order; one reference at a time, so a single thread is all this can use.
+    reference = None  # (index, spectrum)
+    scale = 2 * WEAVE_SAMPLE_STEP  # sensor pixels per sample
+    _apply_sched_role("analysis")
+    while True:
+        index, sample = weave_queue.get()
+        try:
+            spectrum = _weave_spectrum(sample)
+            if reference is not None and reference[0] < index and reference[1].shape == spectrum.shape:
+                dy, dx, peak = _phase_correlate(reference[1], spectrum, sample.shape)
+                _journal_append({
+                    "type": "weave",
+                    "index": index,
+                    "ref": reference[0],
+                    "dx": round(dx * scale, 2),
+                    "dy": round(dy * scale, 2),
+                    "peak": round(peak, 3),
+                })
+            reference = (index, spectrum)
+        except Exception as exc:
+            logging.warning("weave: failed for frame %d: %s", index, exc)
+        finally:
+            weave_queue.task_done()
+
+def _queue_weave_sample(index: int, request) -> None:
+    global weave_worker_running
+    if not weave_worker_running:
+        weave_worker_running = True
+        threading.Thread(target=_weave_worker, daemon=True).start()
+    try:
+        weave_queue.put_nowait((index, _raw_green_roi(request, weave_roi, WEAVE_SAMPLE_STEP)))
+    except queue.Full:
+        logging.debug("weave: worker behind, skipping frame %d", index)
+
+
+# --- gate crop ---
+# With --crop-to-gate, every frame of a session is stored as just the gate aperture plus a margin. The
+# aperture is found on the flat-field master, which is an empty, evenly lit gate, so no picture content
+# can be taken for its edges; the calibration saves it next to the masters.
+def _find_gate_bounds(
+    sample: np.ndarray, width: int, height: int, min_size: tuple, margin: float = CROP_MARGIN
+) -> Optional[tuple]:
+    """(x, y, width, height) in raw pixels, on even coordinates, of the lit gate plus `margin` in a green
+    sample image taken every CROP_SAMPLE_STEP Bayer quads; None if there is no clear gate to crop to."""
+    image = sample.astype(np.float32)
+    scale = 2 * CROP_SAMPLE_STEP  # raw pixels per sample
+    bounds = []
+    for axis, size, min_extent in ((0, width, min_size[0]), (1, height, min_size[1])):
+        profile = np.convolve(np.pad(image.mean(axis=axis), 2, mode="edge"), np.ones(5) / 5, mode="valid")
+        # The gate edges are the steepest rise in the first half and the steepest fall in the second.
+        gradient = np.diff(profile)
+        center = len(gradient) // 2
+        rise = int(np.argmax(gradient[:center]))
+        fall = center + int(np.argmin(gradient[center:]))
+        last = len(profile) - 1
+
+        def step(edge: int) -> float:
+            return profile[min(edge + CROP_EDGE_SPAN, last)] - profile[max(edge - CROP_EDGE_SPAN + 1, 0)]
+
+        # An edge without the contrast of the gate surround lies outside the sensor on that side.
+        start = (rise + 1) * scale if step(rise) >= CROP_MIN_CONTRAST else 0
+        end = (fall + 1) * scale if -step(fall) >= CROP_MIN_CONTRAST else size
+        if end - start < min_extent:
+            return None
+        pad = int(size * margin)
+        start = max(0, start - pad) & ~1
+        end = min(size, end + pad)
+        bounds.append((start, (end - start) & ~1))
+    (x, crop_width), (y, crop_height) = bounds
+    if crop_width * crop_height >= 0.95 * width * height:
+        return None
+    return x, y, crop_width, crop_height
+
+def _gate_path(resolution: str) -> str:
+    return os.path.join(CALIBRATION_DIR, f"{resolution}-gate.json")
+
+def _find_flat_gate(resolution: str, flat: np.ndarray, raw_format: str) -> tuple:
+    """(aperture, crop rect) of the empty gate in a flat master; either can be None."""
+    width, height = RESOLUTION_RAW_SIZES[resolution]
+    column = raw_format[1:3].index("G")  # the green pixel of the first Bayer row
+    step = 2 * CROP_SAMPLE_STEP
+    sample = flat[0::step, column::step] / 16.0  # 8-bit levels, like CROP_MIN_CONTRAST
+    aperture = _find_gate_bounds(sample, width, height, CROP_MIN_APERTURE[resolution], margin=0.0)
+    crop = _find_gate_bounds(sample, width, height, CROP_MIN_APERTURE[resolution])
+    return aperture, crop
+
+def _save_gate_bounds(resolution: str, aperture: Optional[tuple], crop: Optional[tuple]) -> None:
+    path = _gate_path(resolution)
+    if aperture is None:
+        logging.info(
+            "calibration: no gate aperture found in the %s flat, --crop-to-gate stores full frames", resolution
+        )
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
         return
-    if not os.path.isfile(MCU_FLASH_SCRIPT):
-        mcu_flash_error = f"missing flash script: {MCU_FLASH_SCRIPT}"
-        logging.error("mcu: %s", mcu_flash_error)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        # rect: what --crop-to-gate stores (None if that's about the whole raw); aperture: the lit gate itself
+        json.dump({"rect": list(crop) if crop else None, "aperture": list(aperture)}, handle)
+    os.replace(tmp_path, path)
+    logging.info("calibration: %s gate aperture at %s", resolution, aperture)
+
+def _load_gate(resolution: Optional[str], key: str) -> Optional[tuple]:
+    """The "rect" or "aperture" the last flat calibration found for `resolution`, if any."""
+    try:
+        with open(_gate_path(resolution), "r", encoding="utf-8") as handle:
+            return tuple(int(value) for value in json.load(handle)[key])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _detect_session_crop(request) -> None:
+    width, height = request.config["raw"]["size"]
+    resolution = next((name for name, size in RESOLUTION_RAW_SIZES.items() if size == (width, height)), None)
+    crop = _load_gate(resolution, "rect")
+    if crop is None or crop[0] + crop[2] > width or crop[1] + crop[3] > height:
+        logging.info(
+            "crop: no gate aperture from a flat-field calibration at %dx%d, storing full frames", width, height
+        )
         return
-    mcu_flash_in_progress = True
-    logging.info("mcu: flashing start")
-    show_screen("updating-ino")
-    result = subprocess.run(
-        ["bash", MCU_FLASH_SCRIPT],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
+    state.crop = crop
+    _journal_append({"type": "crop", "rect": list(crop)})
+    logging.info(
+        "crop: storing %dx%d at %d,%d of %dx%d (%.0f%% of the pixels)",
+        crop[2], crop[3], crop[0], crop[1], width, height, 100.0 * crop[2] * crop[3] / (width * height),
     )
-    if result.stdout:
-        logging.info("mcu: flash stdout: %s", result.stdout.strip())
-    if result.stderr:
-        logging.info("mcu: flash stderr: %s", result.stderr.strip())
-    if result.returncode == 0:
-        logging.info("mcu: flashing completed")
-    else:
-        logging.error("mcu: flashing failed (code=%s)", result.returncode)
-    mcu_flash_in_progress = False
-    if last_status_screen:
-        show_screen(last_status_screen)
-    else:
-        show_ready_to_scan()
 
-def _ensure_usb_mount() -> bool:
-    if os.path.ismount("/mnt/usb"):
-        return True
-    if sleep_mode:
-        return False
-    disk = None
+def _cropped_raw_config(config: dict, crop: Optional[tuple]) -> dict:
+    if crop is None:
+        return config
+    return {**config, "size": crop[2:], "stride": crop[2] // 2 * 3}
+
+def _copy_raw(request, crop: Optional[tuple]) -> tuple:
+    """A packed copy of the raw stream, cut down to `crop` if given, and the stream config that fits it."""
+    config = request.config["raw"]
+    if crop is None:
+        return request.make_array("raw"), config
+    x, y, width, height = crop  # even, so the Bayer order doesn't change
+    with MappedArray(request, "raw") as mapped:
+        groups = _csi2p_groups(mapped.array, config)
+        packed = np.ascontiguousarray(groups[y : y + height, x // 2 : (x + width) // 2]).reshape(height, -1)
+    return packed, _cropped_raw_config(config, crop)
+
+def _save_raw_dng(request, path: str, crop: Optional[tuple]) -> None:
+    if crop is None:
+        request.save_dng(path, name="raw")
+        return
+    packed, config = _copy_raw(request, crop)
+    camera.helpers.save_dng(packed, request.get_metadata(), config, path)
+
+
+# --- scene cuts ---
+# A histogram signature of every frame, from the raw samples the blank-frame check takes anyway.
+# A cut is a jump in histogram distance well above what the recent frames showed; memory use stays
+# the same however long the reel, the cuts themselves go to the journal.
+def _scene_signature(planes: dict, black: float) -> np.ndarray:
+    histograms = []
+    for channel in "RGB":
+        levels = np.sqrt(np.clip((planes[channel] - black) / (SENSOR_WHITE_LEVEL - black), 0.0, 1.0))
+        histogram = np.bincount(
+            np.minimum((levels * SCENE_HISTOGRAM_BINS).astype(np.intp), SCENE_HISTOGRAM_BINS - 1),
+            minlength=SCENE_HISTOGRAM_BINS,
+        )
+        histograms.append(histogram / max(1, histogram.sum()))
+    return np.stack(histograms)
+
+def _scene_worker() -> None:
+    previous = None  # (index, signature)
+    recent = deque(maxlen=SCENE_CUT_WINDOW)
+    last_cut = None
+    _apply_sched_role("analysis")
+    while True:
+        index, planes, black = scene_queue.get()
+        try:
+            signature = _scene_signature(planes, black)
+            if previous is None or previous[0] >= index:  # first frame, or a new session
+                recent.clear()
+                last_cut = index
+            else:
+                # Half the L1 distance: 0 for identical histograms, 1 for disjoint ones; averaged over RGB.
+                score = float(np.abs(signature - previous[1]).sum(axis=1).mean() / 2)
+                baseline = float(np.median(recent)) if recent else 0.0
+                if (
+                    score >= SCENE_CUT_MIN_SCORE
+                    and score >= SCENE_CUT_RATIO * baseline
+                    and index - last_cut >= SCENE_MIN_FRAMES
+                ):
+                    last_cut = index
+                    _journal_append({"type": "cut", "index": index, "score": round(score, 3)})
+                    logging.info("Scene cut at frame %d (%.2f)", index, score)
+                recent.append(score)
+            previous = (index, signature)
+        except Exception as exc:
+            logging.warning("scene cuts: failed for frame %d: %s", index, exc)
+        finally:
+            scene_queue.task_done()
+
+def _queue_scene_sample(index: int, planes: dict, black: float) -> None:
+    global scene_worker_running
+    if not scene_worker_running:
+        scene_worker_running = True
+        threading.Thread(target=_scene_worker, daemon=True).start()
+    try:
+        scene_queue.put_nowait((index, planes, black))
+    except queue.Full:
+        logging.debug("scene cuts: worker behind, skipping frame %d", index)
+
+def _edl_timecode(frame: int) -> str:
+    return "{:02d}:{:02d}:{:02d}:{:02d}".format(
+        frame // (3600 * EDL_FPS), frame // (60 * EDL_FPS) % 60, frame // EDL_FPS % 60, frame % EDL_FPS
+    )
+
+def _scene_edl(session_name: str, frames: list, cuts: dict) -> list:
+    """CMX3600 EDLs with one event per scene and chunk, for the sorted indices of the stored `frames`.
+
+    Resolve imports every chunk dir as an image sequence clip of its own, so a scene that crosses a
+    chunk boundary becomes one event per clip, with the chunk dir as reel and the sequence as clip
+    name. Source timecode is the frame number at EDL_FPS, which is how Resolve times DNG sequences;
+    the record side starts at Resolve's default 01:00:00:00. After EDL_MAX_EVENTS events the next
+    EDL starts, as a timeline of its own.
+    """
+    first_index, last_index = frames[0], frames[-1]
+    chunks = {}  # chunk -> (first, last) stored frame
+    for index in frames:
+        chunk = index // SESSION_CHUNK_FRAMES
+        chunks[chunk] = (chunks.get(chunk, (index,))[0], index)
+    starts = [first_index] + sorted(index for index in cuts if first_index < index <= last_index)
+    ends = starts[1:] + [last_index + 1]
+    edls = []
+    record = 3600 * EDL_FPS
+    event = EDL_MAX_EVENTS
+    for scene, (start, end) in enumerate(zip(starts, ends), 1):
+        while start < end:
+            chunk = start // SESSION_CHUNK_FRAMES
+            stop = min(end, (chunk + 1) * SESSION_CHUNK_FRAMES)
+            if chunk in chunks:
+                if event == EDL_MAX_EVENTS:
+                    title = session_name if not edls else f"{session_name} part {len(edls) + 1}"
+                    lines = [f"TITLE: {title}", "FCM: NON-DROP FRAME", ""]
+                    edls.append(lines)
+                    record = 3600 * EDL_FPS
+                    event = 0
+                event += 1
+                lines.append("{:03d}  {:<8} V     C        {} {} {} {}".format(
+                    event,
+                    "{:04d}".format(chunk),
+                    _edl_timecode(start),
+                    _edl_timecode(stop),
+                    _edl_timecode(record),
+                    _edl_timecode(record + stop - start),
+                ))
+                lines.append("* FROM CLIP NAME: [{:08d}-{:08d}].dng".format(*chunks[chunk]))
+                lines.append(f"* SCENE {scene}: FRAMES {start}-{stop - 1}")
+                lines.append("")
+            record += stop - start
+            start = stop
+    return ["\r\n".join(lines) for lines in edls]
+
+def _preview_frame_callback(request) -> None:
+    """Runs in the camera thread for every completed request; analyzers must stay well below a frame time."""
+    if state.scanning:
+        return
+    for analyzer in preview_analyzers:
+        try:
+            analyzer(request)
+        except Exception as exc:
+            logging.debug("preview analyzer %s failed: %s", analyzer.__name__, exc)
+
+def _exposure_assist_analyzer(request) -> None:
+    global exposure_assist_hist, exposure_assist_frames, exposure_assist_key, exposure_recommendation_us
+    metadata = request.get_metadata()
+    exposure = metadata.get("ExposureTime")
+    gain = metadata.get("AnalogueGain", 1.0)
+    if not exposure:
+        return
+    key = (exposure, round(gain, 2))
+    if key != exposure_assist_key or exposure_assist_hist is None:
+        # Preview runs on AE; only frames taken with the same settings can share a histogram.
+        exposure_assist_key = key
+        exposure_assist_hist = np.zeros((3, SENSOR_WHITE_LEVEL + 1), dtype=np.int64)
+        exposure_assist_frames = 0
+    planes = _raw_bayer_planes(request, RAW_SAMPLE_STEP)
+    for row, channel in enumerate("RGB"):
+        exposure_assist_hist[row] += np.bincount(planes[channel], minlength=SENSOR_WHITE_LEVEL + 1)
+    exposure_assist_frames += 1
+    if exposure_assist_frames < EXPOSURE_ASSIST_BURST_FRAMES:
+        return
+
+    cumulative = np.cumsum(exposure_assist_hist, axis=1)
+    brightest = max(
+        int(np.searchsorted(row, row[-1] * EXPOSURE_ASSIST_PERCENTILE)) for row in cumulative
+    )
+    exposure_assist_hist = None
+    black = _raw_black_level(metadata)
+    if brightest >= EXPOSURE_CLIP_DN or brightest <= black:
+        return  # no usable headroom reading in this burst
+    # Raw is linear: scale the preview exposure so the brightest area lands on the target.
+    # Assumes the scan runs at unity analogue gain.
+    signal_per_us = (brightest - black) / (exposure * gain)
+    recommended = EXPOSURE_ASSIST_TARGET * (SENSOR_WHITE_LEVEL - black) / signal_per_us
+    exposure_recommendation_us = int(min(max(recommended, SHUTTER_SPEED_RANGE[0]), SHUTTER_SPEED_RANGE[1]))
+
+def _focus_analyzer(request) -> None:
+    """Variance of the Laplacian on the green channel, plus the edge mask for focus peaking."""
+    global focus_metric, focus_peak, focus_peaking_mask
+    if state.zoom_mode == ZoomMode.Z1_1:
+        return
+    with MappedArray(request, "main") as mapped:
+        green = mapped.array[: preview_size[1], : preview_size[0], 1].astype(np.int16)
+    laplacian = (
+        4 * green[1:-1, 1:-1] - green[:-2, 1:-1] - green[2:, 1:-1] - green[1:-1, :-2] - green[1:-1, 2:]
+    )
+    focus_metric = float(laplacian.var())
+    focus_peak = focus_metric if focus_peak is None else max(focus_peak, focus_metric)
+    if focus_peaking and time.monotonic() - last_focus_overlay >= FOCUS_OVERLAY_INTERVAL_S / 2:
+        # The mask is only drawn every FOCUS_OVERLAY_INTERVAL_S; skip it on frames nobody will see.
+        mask = np.zeros(green.shape, dtype=bool)
+        mask[1:-1, 1:-1] = np.abs(laplacian) >= FOCUS_PEAKING_THRESHOLD
+        focus_peaking_mask = mask
+
+def _reset_focus_metric() -> None:
+    global focus_metric, focus_peak, focus_peaking_mask
+    focus_metric = None
+    focus_peak = None
+    focus_peaking_mask = None
+
+def _refresh_focus_overlay(now: float) -> None:
+    global last_focus_overlay
+    if focus_metric is None or now - last_focus_overlay < FOCUS_OVERLAY_INTERVAL_S:
+        return
+    last_focus_overlay = now
+    _render_scan_overlay()
+
+def _build_negative_luts(sample: np.ndarray) -> Optional[np.ndarray]:
+    """Per-channel 8-bit LUTs mapping the film's density above base to display brightness; None if the
+    sample has no plausible film base (empty or dark gate, clipped highlights).
+
+    Normalizing each channel between its own base and densest level is what removes the orange mask.
+    """
+    bases = [int(np.percentile(sample[..., channel], NEGATIVE_BASE_PERCENTILE)) for channel in range(3)]
+    low, high = NEGATIVE_BASE_RANGE
+    if max(bases) < low or max(bases) > high:
+        logging.debug("negative preview: implausible film base %s, sampling again", bases)
+        return None
+    linear = np.maximum((np.arange(256) / 255.0) ** DISPLAY_GAMMA, 1e-4)
+    luts = np.empty((3, 256), dtype=np.uint8)
+    for channel in range(3):
+        values = sample[..., channel]
+        base = linear[bases[channel]]
+        dense = linear[int(np.percentile(values, NEGATIVE_DENSE_PERCENTILE))]
+        density = np.log10(base / linear)
+        density_range = max(float(np.log10(base / dense)), 0.05)
+        luts[channel] = np.round(np.clip(density / density_range, 0.0, 1.0) * 255)
+    return luts
+
+def _pair_luts(luts: np.ndarray) -> tuple:
+    """Fold the three channel LUTs into two 64k tables over 16-bit pixel halves (R+G and B+X).
+
+    Two contiguous lookups are about three times faster than three strided 8-bit ones.
+    """
+    index = np.arange(1 << 16, dtype=np.uint32)
+    low, high = index & 0xFF, index >> 8
+    red_green = luts[0][low].astype(np.uint16) | (luts[1][high].astype(np.uint16) << 8)
+    blue_x = luts[2][low].astype(np.uint16) | (high.astype(np.uint16) << 8)
+    return red_green, blue_x
+
+def _negative_preview_callback(request) -> None:
+    """pre_callback: rewrites the main stream in place before the DRM preview shows it."""
+    global negative_luts, negative_sample_frames
+    if state.scanning:
+        return
+    with MappedArray(request, "main") as mapped:
+        pixels = mapped.array
+        if negative_luts is None:
+            # Only a lit gate with film in it shows the film base.
+            if not lamp_is_on or not ready_to_scan:
+                return
+            negative_sample_frames += 1
+            if negative_sample_frames < NEGATIVE_BASE_SETTLE_FRAMES:
+                return
+            height, width = pixels.shape[:2]
+            top, left = int(height * (1 - NEGATIVE_BASE_ROI) / 2), int(width * (1 - NEGATIVE_BASE_ROI) / 2)
+            luts = _build_negative_luts(pixels[top : height - top : 4, left : width - left : 4, :3])
+            if luts is None:
+                negative_sample_frames = 0
+                return
+            negative_luts = _pair_luts(luts)
+            logging.info("negative preview: sampled film base, LUT white points %s", luts[:, 0].tolist())
+        halves = pixels.view(np.uint16)  # XBGR8888 is R, G, B, X in memory
+        for half, table in enumerate(negative_luts):
+            values = np.ascontiguousarray(halves[..., half])
+            np.take(table, values, out=values, mode="clip")
+            halves[..., half] = values
+
+def _reset_negative_preview() -> None:
+    """Sample the film base again on the next frames, e.g. for the next reel."""
+    global negative_luts, negative_sample_frames
+    negative_luts = None
+    negative_sample_frames = 0
+
+def _format_exposure_recommendation(current_us: int) -> str:
+    text = _format_shutter_speed(exposure_recommendation_us)
+    if current_us > 0:
+        text += f", {math.log2(exposure_recommendation_us / current_us):+.1f} EV"
+    return text
+
+def _refresh_exposure_assist_badge() -> None:
+    global shown_recommendation_us
+    if exposure_recommendation_us == shown_recommendation_us:
+        return
+    shown_recommendation_us = exposure_recommendation_us
+    _render_scan_overlay()
+
+
+# --- remote preview (MJPEG) ---
+# An optional HTTP view of the preview for focusing away from the projector: / shows it in a page,
+# /stream.mjpg is the stream itself, /snapshot.jpg the newest frame. Frames are only copied while
+# someone is watching, at most mjpeg_fps of them, and never while scanning (the analyzers don't
+# run then), so the raw capture doesn't share the CPU with it.
+def _mjpeg_analyzer(request) -> None:
+    global mjpeg_pending, last_mjpeg_frame
+    if not mjpeg_clients:
+        return
+    now = time.monotonic()
+    if now - last_mjpeg_frame < 1.0 / mjpeg_fps:
+        return
+    last_mjpeg_frame = now
+    with MappedArray(request, "main") as mapped:
+        frame = mapped.array[: preview_size[1], : preview_size[0], :3].copy()  # XBGR8888 is R, G, B, X in memory
+    with mjpeg_condition:
+        mjpeg_pending = frame
+        mjpeg_condition.notify_all()
+
+def _mjpeg_encoder_loop() -> None:
+    # Encoding happens here rather than in the camera thread, once per frame for all clients.
+    global mjpeg_pending, mjpeg_jpeg, mjpeg_sequence
+    _apply_sched_role("preview")
+    while True:
+        with mjpeg_condition:
+            while mjpeg_pending is None:
+                mjpeg_condition.wait()
+            frame, mjpeg_pending = mjpeg_pending, None
+        buffer = io.BytesIO()
+        try:
+            Image.fromarray(frame, "RGB").save(buffer, "JPEG", quality=mjpeg_quality)
+        except Exception as exc:
+            logging.warning("mjpeg: failed to encode a frame: %s", exc)
+            continue
+        with mjpeg_condition:
+            mjpeg_jpeg = buffer.getvalue()
+            mjpeg_sequence += 1
+            mjpeg_condition.notify_all()
+
+class MjpegHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/":
+            body = b'<html><body style="margin:0;background:#000"><img src="/stream.mjpg" style="width:100%"></body></html>'
+            self._send(200, "text/html", body)
+        elif self.path == "/snapshot.jpg":
+            self._stream(single=True)
+        elif self.path == "/stream.mjpg":
+            self._stream(single=False)
+        else:
+            self._send(404, "text/plain", b"not found")
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, single: bool):
+        global mjpeg_clients
+        with mjpeg_condition:
+            mjpeg_clients += 1
+        try:
+            seen = mjpeg_sequence
+            if not single:
+                self.send_response(200)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}")
+                self.end_headers()
+            while True:
+                with mjpeg_condition:
+                    # Wait for a newer frame; none arrive while scanning or with the camera off.
+                    mjpeg_condition.wait_for(
+                        lambda: mjpeg_jpeg is not None and mjpeg_sequence != seen, timeout=2.0 if single else 10.0
+                    )
+                    jpeg, sequence = mjpeg_jpeg, mjpeg_sequence
+                if single:  # a fresh frame if one comes in time, else the last one there is
+                    if jpeg is None:
+                        self._send(503, "text/plain", b"no preview frame yet")
+                    else:
+                        self._send(200, "image/jpeg", jpeg)
+                    return
+                if sequence == seen or jpeg is None:
+                    continue
+                seen = sequence
+                self.wfile.write(
+                    f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode()
+                )
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with mjpeg_condition:
+                mjpeg_clients -= 1
+
+    def log_message(self, format, *args):
+        logging.debug("mjpeg: %s %s", self.address_string(), format % args)
+
+def _start_mjpeg_server() -> None:
+    try:
+        server = ThreadingHTTPServer(("", mjpeg_port), MjpegHandler)
+    except OSError as exc:
+        logging.error("mjpeg: can't listen on port %d: %s", mjpeg_port, exc)
+        return
+    server.daemon_threads = True
+    threading.Thread(target=_mjpeg_encoder_loop, daemon=True).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    preview_analyzers.append(_mjpeg_analyzer)
+    logging.info("mjpeg: preview at http://%s:%d/", socket.gethostname(), mjpeg_port)
+
+
+# --- DNG tag patching ---
+def _append_dng_tags(path: str, tags: dict) -> None:
+    """Add tags to IFD0 of a little-endian DNG without rewriting it.
+
+    A copy of IFD0 with the extra entries is appended to the file and the header pointed at it; every
+    offset in the original entries stays valid. Costs a few kB of appended data, no image I/O.
+    `tags` maps tag id -> (tiff type, count, payload bytes).
+    """
+    with open(path, "r+b") as handle:
+        header = handle.read(8)
+        if header[:4] != b"II*\x00":
+            raise ValueError(f"{path}: not a little-endian TIFF")
+        (ifd_offset,) = struct.unpack("<I", header[4:8])
+        handle.seek(ifd_offset)
+        (count,) = struct.unpack("<H", handle.read(2))
+        raw_entries = handle.read(12 * count)
+        next_ifd = handle.read(4)
+        entries = {
+            struct.unpack("<H", raw_entries[i:i + 2])[0]: raw_entries[i:i + 12] for i in range(0, 12 * count, 12)
+        }
+
+        end = handle.seek(0, os.SEEK_END)
+        cursor = end + (end & 1)  # TIFF values start on word boundaries
+        blob = bytearray(cursor - end)
+        for tag, (type_id, value_count, payload) in tags.items():
+            if len(payload) <= 4:
+                value_field = payload.ljust(4, b"\x00")
+            else:
+                value_field = struct.pack("<I", cursor)
+                blob += payload
+                cursor += len(payload)
+                if cursor & 1:
+                    blob += b"\x00"
+                    cursor += 1
+            entries[tag] = struct.pack("<HHI", tag, type_id, value_count) + value_field
+        ifd = struct.pack("<H", len(entries)) + b"".join(entries[tag] for tag in sorted(entries)) + next_ifd
+        handle.write(bytes(blob) + ifd)
+        handle.seek(4)
+        handle.write(struct.pack("<I", cursor))
+
+def _dng_opcode(opcode_id: int, params: bytes) -> bytes:
+    # Opcode lists are big-endian regardless of the file's byte order. Flag 1: optional for readers.
+    return struct.pack(">IIII", opcode_id, 0x01030000, 1, len(params)) + params
+
+def _dng_opcode_list(opcodes: list) -> tuple:
+    payload = struct.pack(">I", len(opcodes)) + b"".join(opcodes)
+    return (TIFF_TYPE_UNDEFINED, len(payload), payload)
+
+def _gain_map_opcode(top: int, left: int, bottom: int, right: int, gains: np.ndarray) -> bytes:
+    """GainMap for one Bayer phase (pitch 2), map points at the centers of a regular grid."""
+    points_v, points_h = gains.shape
+    params = struct.pack(">IIIIIIIIII", top, left, bottom, right, 0, 1, 2, 2, points_v, points_h)
+    params += struct.pack(">dddd", 1.0 / points_v, 1.0 / points_h, 0.5 / points_v, 0.5 / points_h)
+    params += struct.pack(">I", 1) + gains.astype(">f4").tobytes()
+    return _dng_opcode(DNG_OPCODE_GAIN_MAP, params)
+
+def _delta_opcode(opcode_id: int, bottom: int, right: int, deltas: np.ndarray) -> bytes:
+    params = struct.pack(">IIIIIIIII", 0, 0, bottom, right, 0, 1, 1, 1, len(deltas))
+    return _dng_opcode(opcode_id, params + deltas.astype(">f4").tobytes())
+
+
+# --- flat-field / dark calibration ---
+# Trigger: with no film loaded (insert-film screen), press LIGHT three times within three seconds.
+# Whatever the lamp is doing then gets captured first (flat with the lamp on, dark with it off),
+# then the screen asks for one more LIGHT press for the other kind. Darks are captured at the current
+# shutter speed, flats at one metered on the empty gate; scans pick the nearest shutter speed that has
+# masters. Both are captured for both resolutions.
+def _unpack_raw(packed: np.ndarray, width: int, height: int) -> np.ndarray:
+    groups = packed[:height, : (width // 2) * 3].reshape(height, width // 2, 3).astype(np.uint16)
+    pixels = np.empty((height, width), dtype=np.uint16)
+    pixels[:, 0::2] = (groups[..., 0] << 4) | (groups[..., 2] & 0xF)
+    pixels[:, 1::2] = (groups[..., 1] << 4) | (groups[..., 2] >> 4)
+    return pixels
+
+def _calibration_path(resolution: str, kind: str, shutter_us: int) -> str:
+    return os.path.join(CALIBRATION_DIR, f"{resolution}-{kind}-{shutter_us}us.npy")
+
+def _find_calibration_master(resolution: str, kind: str, shutter_us: int) -> Optional[str]:
+    """Closest shutter speed (on a log scale) with a cached master of this kind and resolution."""
+    prefix = f"{resolution}-{kind}-"
+    try:
+        names = [name for name in os.listdir(CALIBRATION_DIR) if name.startswith(prefix)]
+    except OSError:
+        return None
+    candidates = []
+    for name in names:
+        match = re.fullmatch(re.escape(prefix) + r"(\d+)us\.npy", name)
+        if match:
+            candidates.append((abs(math.log(max(int(match.group(1)), 1) / max(shutter_us, 1))), name))
+    if not candidates:
+        return None
+    return os.path.join(CALIBRATION_DIR, min(candidates)[1])
+
+def _meter_flat_exposure() -> int:
+    """Exposure time that puts the brightest 1% of the empty gate at CALIBRATION_FLAT_TARGET."""
+    exposure = shutter_speed or 1000
+    for _ in range(CALIBRATION_METER_STEPS):
+        camera.set_controls({"AeEnable": False, "ExposureTime": exposure, "AnalogueGain": 1.0})
+        request = _capture_at_exposure(exposure, attempts=30)
+        try:
+            black = _raw_black_level(request.get_metadata())
+            planes = _raw_bayer_planes(request, RAW_SAMPLE_STEP)
+        finally:
+            request.release()
+        level = max(float(np.percentile(plane, 99)) for plane in planes.values())
+        fraction = (level - black) / (SENSOR_WHITE_LEVEL - black)
+        if abs(fraction - CALIBRATION_FLAT_TARGET) <= 0.1 * CALIBRATION_FLAT_TARGET:
+            break
+        # A clipped gate says nothing about how far over it is: come down two stops and look again.
+        scale = CALIBRATION_FLAT_TARGET / fraction if 0.0 < fraction < 0.95 else (0.25 if fraction > 0 else 4.0)
+        exposure = min(max(int(exposure * scale), SHUTTER_SPEED_RANGE[0]), SHUTTER_SPEED_RANGE[1])
+    return exposure
+
+def _capture_calibration_master(kind: str, resolution: str) -> bool:
+    """Capture and save one master; False if it was refused (see the log)."""
+    width, height = RESOLUTION_RAW_SIZES[resolution]
+    exposure = _meter_flat_exposure() if kind == "flat" else shutter_speed
+    camera.set_controls({"AeEnable": False, "ExposureTime": exposure, "AnalogueGain": 1.0})
+    _capture_at_exposure(exposure, attempts=30).release()  # let the new exposure reach the sensor
+    total = np.zeros((height, width), dtype=np.float32)
+    for _ in range(CALIBRATION_FRAMES):
+        request = camera.capture_request()
+        try:
+            packed = request.make_array("raw")
+            raw_format = request.config["raw"]["format"]
+        finally:
+            request.release()
+        if packed.ndim == 1:
+            packed = packed.reshape(height, -1)
+        total += _unpack_raw(packed, width, height)
+    master = np.round(total / CALIBRATION_FRAMES).astype(np.uint16)
+    if kind == "flat":
+        aperture, crop = _find_flat_gate(resolution, master, raw_format)
+        x, y, gate_width, gate_height = aperture or (0, 0, width, height)
+        clipped = int(np.count_nonzero(master[y : y + gate_height, x : x + gate_width] >= EXPOSURE_CLIP_DN))
+        if clipped > CALIBRATION_MAX_CLIPPED * gate_width * gate_height:
+            # A clipped gate would read as too dark in the gain maps and get brightened in every frame.
+            logging.error(
+                "calibration: %s flat master at %s has %d clipped pixels in the gate, not saved",
+                resolution, _format_shutter_speed(exposure), clipped,
+            )
+            return False
+        if clipped:
+            logging.info("calibration: %d clipped pixels left out of the %s gain maps", clipped, resolution)
+    os.makedirs(CALIBRATION_DIR, exist_ok=True)
+    path = _calibration_path(resolution, kind, exposure)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as handle:
+        np.save(handle, master)
+    os.replace(tmp_path, path)
+    logging.info(
+        "calibration: %s %s master at %s saved to %s", resolution, kind, _format_shutter_speed(exposure), path
+    )
+    if kind == "flat":
+        _save_gate_bounds(resolution, aperture, crop)
+    return True
+
+def _calibration_tags(resolution: str, shutter_us: int, crop: Optional[tuple] = None) -> Optional[dict]:
+    """OpcodeList1 (dark row/column pattern) and OpcodeList2 (flat-field gain maps) for a frame."""
+    if not calibration_enabled:
+        return None
+    key = (resolution, shutter_us, crop)
+    if key in calibration_opcode_cache:
+        return calibration_opcode_cache[key]
+
+    dark_path = _find_calibration_master(resolution, "dark", shutter_us)
+    flat_path = _find_calibration_master(resolution, "flat", shutter_us)
+    tags = None
+    try:
+        tags = _build_calibration_tags(dark_path, flat_path, crop, _load_gate(resolution, "aperture"))
+    except (OSError, ValueError) as exc:
+        logging.warning("calibration: failed to load masters for %s: %s", resolution, exc)
+    calibration_opcode_cache[key] = tags
+    if tags:
+        logging.info(
+            "calibration: %s frames get %s",
+            resolution,
+            ", ".join(os.path.basename(path) for path in (dark_path, flat_path) if path),
+        )
+    return tags
+
+def _load_calibration_master(path: str, crop: Optional[tuple]) -> np.ndarray:
+    master = np.load(path).astype(np.float32)
+    if crop is not None:
+        x, y, width, height = crop
+        master = master[y : y + height, x : x + width]
+    return master
+
+def _build_calibration_tags(
+    dark_path: Optional[str],
+    flat_path: Optional[str],
+    crop: Optional[tuple] = None,
+    aperture: Optional[tuple] = None,
+) -> Optional[dict]:
+    tags = {}
+    dark = _load_calibration_master(dark_path, crop) if dark_path else None
+    if dark is not None:
+        height, width = dark.shape
+        # Fixed-pattern offsets relative to the overall black level, which the BlackLevel tag covers.
+        columns = dark.mean(axis=0)
+        rows = (dark - columns).mean(axis=1)
+        opcodes = [
+            _delta_opcode(DNG_OPCODE_DELTA_PER_COLUMN, height, width, -(columns - columns.mean())),
+            _delta_opcode(DNG_OPCODE_DELTA_PER_ROW, height, width, -(rows - rows.mean())),
+        ]
+        tags[DNG_OPCODE_LIST1] = _dng_opcode_list(opcodes)
+    if flat_path:
+        flat = _load_calibration_master(flat_path, crop)
+        height, width = flat.shape
+        # Only the lit aperture is corrected; the gate surround (and crop margin) keeps gain 1.0.
+        lit = np.ones(flat.shape, dtype=bool)
+        if aperture is not None:
+            x, y, aperture_width, aperture_height = aperture
+            if crop is not None:
+                x, y = x - crop[0], y - crop[1]
+            lit[:] = False
+            lit[max(y, 0) : max(y + aperture_height, 0), max(x, 0) : max(x + aperture_width, 0)] = True
+        lit &= flat < EXPOSURE_CLIP_DN  # hot and stuck pixels
+        # Only the black level: the dark master was taken at the scan's shutter speed, not the flat's.
+        flat -= _raw_black_level({})
+        points_v, points_h = CALIBRATION_GAIN_MAP_POINTS
+        opcodes = []
+        for top in (0, 1):
+            for left in (0, 1):
+                plane, mask = flat[top::2, left::2], lit[top::2, left::2]
+                rows, columns = plane.shape[0] // points_v * points_v, plane.shape[1] // points_h * points_h
+                shape = (points_v, rows // points_v, points_h, columns // points_h)
+                counts = mask[:rows, :columns].reshape(shape).sum(axis=(1, 3))
+                sums = np.where(mask, plane, 0.0)[:rows, :columns].reshape(shape).sum(axis=(1, 3))
+                cells = np.maximum(sums / np.maximum(counts, 1), 1.0)
+                # Gain 1.0 in the middle of the gate, so only the falloff is corrected, not the LED color.
+                ratio = cells[points_v // 2, points_h // 2] / cells
+                gains = np.minimum(ratio, CALIBRATION_MAX_GAIN)
+                # Cells mostly outside the aperture; without one, cells too dark to be lit gate.
+                unlit = counts < shape[1] * shape[3] / 2
+                if aperture is None:
+                    unlit |= ratio > CALIBRATION_MAX_GAIN
+                gains[unlit] = 1.0
+                opcodes.append(_gain_map_opcode(top, left, height, width, gains))
+        tags[DNG_OPCODE_LIST2] = _dng_opcode_list(opcodes)
+    return tags or None
+
+def _note_light_press(lamp_on: bool) -> bool:
+    """Track LIGHT presses; returns True if the press was consumed by the calibration."""
+    global calibration_lamp_on
+    if calibration_running:
+        calibration_lamp_on = lamp_on
+        calibration_lamp_event.set()
+        return True
+    if ready_to_scan or state.scanning:
+        calibration_light_presses.clear()
+        return False
+    now = time.monotonic()
+    calibration_light_presses.append(now)
+    if (
+        len(calibration_light_presses) == CALIBRATION_GESTURE_PRESSES
+        and now - calibration_light_presses[0] <= CALIBRATION_GESTURE_S
+    ):
+        calibration_light_presses.clear()
+        _start_calibration(lamp_on)
+        return True
+    return False
+
+def _start_calibration(lamp_on: bool) -> None:
+    global calibration_running, calibration_lamp_on
+    calibration_running = True
+    calibration_lamp_on = lamp_on
+    logging.info("calibration: started with the lamp %s", "on" if lamp_on else "off")
+    threading.Thread(target=_calibration_worker, daemon=True).start()
+
+def _calibration_worker() -> None:
+    global calibration_running
+    started_resolution = _current_resolution()
+    kinds = ["flat", "dark"] if calibration_lamp_on else ["dark", "flat"]
+    refused = []
+    try:
+        camera_start()
+        for position, kind in enumerate(kinds):
+            if position > 0:
+                calibration_lamp_event.clear()
+                want_on = kind == "flat"
+                show_update_screen([
+                    "Calibration",
+                    f"Press LIGHT to turn the lamp {'on' if want_on else 'off'}",
+                    f"for the {kind} frames.",
+                ])
+                if not calibration_lamp_event.wait(CALIBRATION_LAMP_TIMEOUT_S) or calibration_lamp_on != want_on:
+                    logging.info("calibration: no lamp change, skipping %s frames", kind)
+                    break
+            for resolution in ("4K", "2K"):
+                show_update_screen([
+                    "Calibration",
+                    f"Capturing {kind} frames ({resolution}),",
+                    "keep the gate empty.",
+                ])
+                if _current_raw_size() != RESOLUTION_RAW_SIZES[resolution]:
+                    _reconfigure_camera(RESOLUTION_RAW_SIZES[resolution])
+                if not _capture_calibration_master(kind, resolution):
+                    refused.append(f"{resolution} {kind}")
+        calibration_opcode_cache.clear()
+        if refused:
+            show_update_screen(["Calibration", f"No {', '.join(refused)} master,", "see the log."])
+        else:
+            show_update_screen(["Calibration", "Done."])
+    except Exception as exc:
+        logging.error("calibration failed: %s", exc)
+        show_update_screen(["Calibration", "Failed, see the log."])
+    finally:
+        try:
+            if _current_raw_size() != RESOLUTION_RAW_SIZES[started_resolution]:
+                _reconfigure_camera(RESOLUTION_RAW_SIZES[started_resolution])
+            set_auto_exposure(True)
+        finally:
+            calibration_running = False
+    sleep(2.0)
+    show_screen("insert-film")
+
+def _current_raw_size() -> tuple:
+    return tuple(camera.camera_configuration().get("raw", {}).get("size", ()))
+
+
+# --- exposure bracketing (HDR) ---
+# With --hdr-brackets, every SHOOT_RAW captures the frame at the set shutter speed plus one or two
+# longer exposures. The base exposure stays the reference: highlights keep their place and the longer
+# ones only add shadow precision, merged into a 16-bit linear DNG by a process pool while the
+# controller already advances the film.
+def _exposure_matches(metadata: dict, exposure_us: int) -> bool:
+    exposure = metadata.get("ExposureTime")
+    return exposure is not None and abs(exposure - exposure_us) <= max(200, int(exposure_us * 0.05))
+
+def _capture_at_exposure(exposure_us: int, attempts: int = HDR_SETTLE_ATTEMPTS):
+    """Capture until a request was exposed at `exposure_us` and return it; the caller releases it.
+
+    Falls back to the last capture if the sensor never reports the requested time.
+    """
+    candidate = None
+    try:
+        for _ in range(attempts):
+            if candidate is not None:
+                candidate.release()
+                candidate = None
+            candidate = camera.capture_request()
+            if _exposure_matches(candidate.get_metadata(), exposure_us):
+                return candidate
+    except BaseException:
+        if candidate is not None:
+            candidate.release()
+        raise
+    logging.warning("exposure: sensor did not settle at %s", _format_shutter_speed(exposure_us))
+    return candidate
+
+def _hdr_exposures(base_us: int) -> list:
+    exposures = []
+    for stops in HDR_BRACKET_STOPS[hdr_brackets]:
+        exposure = min(int(round(base_us * 2 ** stops)), SHUTTER_SPEED_RANGE[1])
+        if not exposures or exposure > exposures[-1]:
+            exposures.append(exposure)
+    return exposures
+
+def _capture_brackets(base_request, exposures: list, crop: Optional[tuple] = None) -> list:
+    """(packed raw copy, exposure µs, metadata) for the base request and one capture per longer exposure.
+
+    Picamera2 puts the controls set while a request is held onto the request that replaces it, so each
+    longer exposure time goes out with the next request, one per capture, and the base shutter speed
+    right after the last one. The sensor applies them a fixed number of frames later, in that order: the
+    whole set costs that pipeline depth once plus one capture per bracket, and the base has settled
+    again by the time the film has advanced. Captures are matched by the exposure they report, so one
+    that goes missing is skipped rather than waited for.
+    """
+    base_us = exposures[0]
+    pending = list(exposures[1:])  # still to be captured, in the order they were queued
+    to_queue = pending + [base_us]
+    brackets = []
+    request = base_request
+    captures = 0
+    started = time.monotonic()
+    try:
+        while True:
+            if to_queue:
+                camera.set_controls({"ExposureTime": to_queue.pop(0)})
+            metadata = request.get_metadata()
+            if request is base_request:
+                packed, _ = _copy_raw(request, crop)
+                brackets.append((packed, metadata.get("ExposureTime") or base_us, metadata))
+            else:
+                matches = [i for i, exposure in enumerate(pending) if _exposure_matches(metadata, exposure)]
+                position = matches[0] if matches else None
+                if position is not None:
+                    if position:
+                        logging.warning("HDR: %d bracket(s) never reached the sensor", position)
+                    packed, _ = _copy_raw(request, crop)
+                    brackets.append((packed, metadata.get("ExposureTime") or pending[position], metadata))
+                    del pending[: position + 1]
+                request.release()
+            request = None
+            if not pending or captures >= HDR_SETTLE_ATTEMPTS + len(exposures):
+                break
+            request = camera.capture_request()
+            captures += 1
+    finally:
+        if request is not None and request is not base_request:
+            request.release()
+    if pending:
+        logging.warning("HDR: %d of %d exposures reached the sensor", len(brackets), len(exposures))
+    if _log_frame(state.raw_count):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        logging.debug("HDR: %d exposures in %d extra captures, %.0f ms", len(brackets), captures, elapsed_ms)
+    return brackets
+
+def _merge_brackets(brackets: list, width: int, height: int, black: float) -> np.ndarray:
+    """Merge (packed raw, exposure µs) pairs, base exposure first, into one 16-bit linear raw.
+
+    Runs in a pool process. Values stay in units of the base exposure, scaled from 12 to 16 bit.
+    """
+    base_exposure = brackets[0][1]
+    merged = None
+    for packed, exposure in brackets:
+        if packed.ndim == 1:
+            packed = packed.reshape(height, -1)
+        pixels = _unpack_raw(packed, width, height).astype(np.float32)
+        weight = None
+        if merged is not None:
+            # Longer exposures are less noisy: use them fully below the ramp, not at all once they clip.
+            weight = np.clip((HDR_CLIP_DN - pixels) / (HDR_CLIP_DN - HDR_BLEND_DN), 0.0, 1.0)
+        pixels -= black
+        pixels *= base_exposure / exposure
+        if merged is None:
+            merged = pixels
+            continue
+        pixels -= merged
+        pixels *= weight
+        merged += pixels
+    merged += black
+    merged *= 1 << (16 - SENSOR_BIT_DEPTH)
+    np.clip(merged, 0, 65535, out=merged)
+    return merged.astype(np.uint16)
+
+def _write_merged_dng(merged: np.ndarray, metadata: dict, raw_config: dict, path: str) -> None:
+    height, width = merged.shape
+    config = {
+        "format": "S" + raw_config["format"][1:5] + "16",  # unpacked, so pidng takes the black levels as-is
+        "size": (width, height),
+        "stride": width * 2,
+    }
+    camera.helpers.save_dng(merged.view(np.uint8).reshape(-1), metadata, config, path)
+
+def _hdr_writer_loop() -> None:
+    _apply_sched_role("encode")
+    while True:
+        future, frame_record, metadata, raw_config, tags = hdr_write_queue.get()
+        frame_path = frame_record["path"]
+        try:
+            merged = future.result()
+            _save_frame(
+                lambda path: _write_merged_dng(merged, metadata, raw_config, path),
+                frame_path,
+                tags,
+            )
+            frame_record["size"] = os.path.getsize(frame_path)
+            state.bytes_written += frame_record["size"]
+            state.frames_written += 1
+        except Exception as exc:
+            logging.error("HDR: frame %d not saved: %s", frame_record["index"], exc)
+            frame_record["path"] = None
+        finally:
+            future = merged = None  # don't hold on to a merged frame while waiting for the next one
+            _journal_append(frame_record)
+            hdr_write_queue.task_done()
+
+def _start_hdr_merger() -> None:
+    global hdr_pool, hdr_writer_running
+    if hdr_pool is not None:
+        return
+    # spawn, not fork: by now the scanner runs threads, and soon owns the camera.
+    hdr_pool = ProcessPoolExecutor(
+        max_workers=HDR_MERGE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_apply_sched_settings,
+        initargs=("encode", _sched_settings("encode")),
+    )
+    for _ in range(HDR_MERGE_WORKERS):
+        hdr_pool.submit(int)  # start the workers now rather than on the first frame
+    if not hdr_writer_running:
+        hdr_writer_running = True
+        threading.Thread(target=_hdr_writer_loop, daemon=True).start()
+
+def _queue_hdr_merge(frame_record: dict, brackets: list, raw_config: dict, tags: Optional[dict]) -> None:
+    """Hand a frame's brackets to the pool; blocks only while HDR_MAX_PENDING frames are in flight.
+
+    If the pool is broken, e.g. the kernel killed a worker, the frame is saved from its base exposure
+    alone and the pool is started again for the next one.
+    """
+    global hdr_pool
+    width, height = raw_config["size"]
+    packed, _, metadata = brackets[0]
+    try:
+        future = hdr_pool.submit(
+            _merge_brackets,
+            [(packed, exposure) for packed, exposure, _ in brackets],
+            width,
+            height,
+            _raw_black_level(metadata),
+        )
+    except BrokenProcessPool as exc:
+        logging.error("HDR: merge pool failed, saving frame %d without brackets: %s", frame_record["index"], exc)
+        pool, hdr_pool = hdr_pool, None
+        pool.shutdown(wait=False, cancel_futures=True)
+        frame_path = frame_record["path"]
+        try:
+            _save_frame(lambda path: camera.helpers.save_dng(packed, metadata, raw_config, path), frame_path, tags)
+            frame_record["size"] = os.path.getsize(frame_path)
+            state.bytes_written += frame_record["size"]
+            state.frames_written += 1
+        except Exception as exc:
+            logging.error("HDR: frame %d not saved: %s", frame_record["index"], exc)
+            frame_record["path"] = None
+        _journal_append(frame_record)
+        _start_hdr_merger()
+        return
+    if tags and DNG_OPCODE_LIST1 in tags:
+        # The dark masters are in 12-bit DN of the stored values; the gain maps don't care about scale.
+        tags = {tag: value for tag, value in tags.items() if tag != DNG_OPCODE_LIST1} or None
+    hdr_write_queue.put((future, frame_record, metadata, raw_config, tags))
+
+def _wait_for_hdr_merges() -> None:
+    if hdr_writer_running:
+        hdr_write_queue.join()
+
+
+# --- review proxies ---
+# With --proxies, every saved frame also gets a small JPEG in <session>/proxies/, and every 48 frames a
+# contact sheet in <session>/contact-sheets/, both shipped like the frames. The capture thread only
+# copies every n-th Bayer quad; a single process at idle priority does the rest, so it only ever gets
+# CPU time the scan doesn't want. It has its own GIL, so it can't hold up the capture thread either.
+def _lower_process_priority(settings: Optional[dict] = None) -> None:
+    _apply_sched_settings("preview", settings)  # for the CPUs; SCHED_IDLE below outranks the nice value
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        os.nice(19)
+
+def _proxy_sample(request, crop: Optional[tuple]) -> tuple:
+    """Copies of every n-th Bayer quad's two rows (still packed), inside `crop` if given."""
+    config = request.config["raw"]
+    x, y, width, height = crop or (0, 0, *config["size"])
+    step = max(1, round(width / 2 / PROXY_WIDTH))
+    with MappedArray(request, "raw") as mapped:
+        quads = _csi2p_groups(mapped.array, config)[y : y + height, x // 2 : (x + width) // 2]
+        return quads[0::2 * step, ::step].copy(), quads[1::2 * step, ::step].copy()
+
+def _render_proxy(session_name: str, index: int, rows: tuple, order: str, black: float, gains: tuple,
+                  negative: bool) -> list:
+    """Runs in the proxy process. Returns (path below RAW_DIRS_PATH, JPEG bytes) pairs to publish."""
+    channels = {"R": [], "G": [], "B": []}
+    for row_index, quads in enumerate(rows):
+        high = quads[..., :2].astype(np.uint16) << 4
+        low = quads[..., 2]
+        channels[order[row_index * 2]].append(high[..., 0] | (low & 0xF))
+        channels[order[row_index * 2 + 1]].append(high[..., 1] | (low >> 4))
+    height = min(len(rows[0]), len(rows[1]))
+    rgb = np.stack([np.mean([plane[:height] for plane in channels[name]], axis=0) for name in "RGB"], axis=-1)
+    rgb = np.clip((rgb - black) / (SENSOR_WHITE_LEVEL - black), 0.0, 1.0)
+    rgb[..., 0] *= gains[0]
+    rgb[..., 2] *= gains[1]
+    if negative:
+        base = np.maximum(np.percentile(rgb.reshape(-1, 3), NEGATIVE_BASE_PERCENTILE, axis=0), 1e-3)
+        rgb = 1.0 - rgb / base
+    rgb = np.clip(rgb, 0.0, 1.0) ** (1 / DISPLAY_GAMMA)
+    image = Image.fromarray((rgb * 255).astype(np.uint8), "RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=PROXY_JPEG_QUALITY)
+    relpath = os.path.join(session_name, PROXY_DIR, os.path.splitext(_frame_relpath(index))[0] + ".jpg")
+    files = [(relpath, buffer.getvalue())]
+    files.extend(_add_to_contact_sheet(session_name, index, image))
+    return files
+
+def _add_to_contact_sheet(session_name: str, index: int, image) -> list:
+    """Runs in the proxy process. Returns the finished sheet once a frame for the next one arrives."""
+    global contact_sheet
+    columns, rows = CONTACT_SHEET_GRID
+    first_index = index - index % (columns * rows)
+    finished = []
+    if contact_sheet is not None and contact_sheet[:2] != (session_name, first_index):
+        finished = _finish_contact_sheet()
+    thumb_size = (CONTACT_SHEET_THUMB_WIDTH, CONTACT_SHEET_THUMB_WIDTH * image.height // image.width)
+    if contact_sheet is None:
+        sheet = Image.new("RGB", (columns * thumb_size[0], rows * (thumb_size[1] + 20)), (24, 24, 24))
+        contact_sheet = (session_name, first_index, sheet)
+    sheet = contact_sheet[2]
+    position = index - first_index
+    x = position % columns * thumb_size[0]
+    y = position // columns * (thumb_size[1] + 20)
+    sheet.paste(image.resize(thumb_size), (x, y))
+    ImageDraw.Draw(sheet).text((x + 4, y + thumb_size[1] + 4), str(index), fill=(200, 200, 200))
+    return finished
+
+def _finish_contact_sheet() -> list:
+    global contact_sheet
+    if contact_sheet is None:
+        return []
+    session_name, first_index, sheet = contact_sheet
+    contact_sheet = None
+    buffer = io.BytesIO()
+    sheet.save(buffer, "JPEG", quality=PROXY_JPEG_QUALITY)
+    return [(os.path.join(session_name, CONTACT_SHEET_DIR, "{:08d}.jpg".format(first_index)), buffer.getvalue())]
+
+def _publish_proxy_files(future) -> None:
+    proxy_slots.release()
+    try:
+        files = future.result()
+    except Exception as exc:
+        logging.warning("proxies: %s", exc)
+        return
+    for relpath, data in files:
+        _publish_session_file(os.path.join(RAW_DIRS_PATH, os.path.dirname(relpath)), os.path.basename(relpath), data)
+
+def _start_proxy_renderer() -> None:
+    global proxy_pool
+    if proxy_pool is None:
+        proxy_pool = ProcessPoolExecutor(
+            max_workers=1,  # one, so the contact sheet sees the frames in order
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_lower_process_priority,
+            initargs=(_sched_settings("preview"),),
+        )
+        # Start the worker and the executor's manager thread now, from setup(), rather than on the first
+        # frame, where they would inherit the capture role and the worker would import this module there.
+        proxy_pool.submit(int)
+
+def _queue_proxy(index: int, request) -> None:
+    if not proxy_slots.acquire(blocking=False):
+        logging.debug("proxies: renderer behind, skipping frame %d", index)
+        return
+    try:
+        metadata = request.get_metadata()
+        future = proxy_pool.submit(
+            _render_proxy,
+            os.path.basename(os.path.normpath(state.raws_path)),
+            index,
+            _proxy_sample(request, state.crop),
+            request.config["raw"]["format"][1:5],
+            _raw_black_level(metadata),
+            tuple(metadata.get("ColourGains", (1.0, 1.0))),
+            negative_preview,
+        )
+    except Exception as exc:
+        # E.g. BrokenProcessPool after the kernel killed the renderer: not a reason to stop scanning.
+        proxy_slots.release()
+        logging.error("proxies: renderer failed, no more proxies this session: %s", exc)
+        state.proxies = False
+        _stop_proxy_renderer()
+        return
+    except BaseException:
+        proxy_slots.release()
+        raise
+    future.add_done_callback(_publish_proxy_files)
+
+def _stop_proxy_renderer() -> None:
+    global proxy_pool
+    pool, proxy_pool = proxy_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _finish_proxies() -> None:
+    """Queue the last, partly filled contact sheet of the session."""
+    if proxy_pool is None or not proxy_slots.acquire(timeout=5.0):
+        return  # otherwise the next session's first frame finishes it
+    proxy_pool.submit(_finish_contact_sheet).add_done_callback(_publish_proxy_files)
+
+
+# --- frame verification ---
+# In local mode lsyncd only copies. Each frame is read back from the USB drive and compared with the
+# hash taken on the ramdisk; only a matching copy lets the source go. In remote mode rsync's own
+# whole-file checksum covers the transfer and --remove-source-files stays in charge.
+def _frame_destination(source_path: str) -> str:
+    return os.path.join(USB_MOUNT_POINT, os.path.relpath(source_path, RAW_DIRS_PATH))
+
+def _enqueue_frame_verification(source_path: str, expected: Optional[str] = None) -> None:
+    if storage_location != 1:
+        return
+    with frame_verify_lock:
+        entry = frame_verify_pending.setdefault(
+            source_path, {"expected": None, "attempts": 0, "busy": False}
+        )
+        if expected is not None:
+            entry["expected"] = expected
+    _start_frame_verifier()
+
+def _sweep_ramdisk_for_verification() -> None:
+    """Pick up frames left on the ramdisk without a journaled hash (earlier runs, remote-mode leftovers)."""
+    count = 0
+    for root, dirs, files in os.walk(RAW_DIRS_PATH):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            with frame_verify_lock:
+                if path in frame_verify_pending:
+                    continue
+                frame_verify_pending[path] = {"expected": None, "attempts": 0, "busy": False}
+            count += 1
+    if count:
+        logging.info("verify: %d files on the ramdisk are waiting for a verified copy", count)
+
+def _frame_verify_worker() -> None:
+    _apply_sched_role("analysis")
+    while True:
+        source_path = frame_verify_queue.get()
+        with frame_verify_lock:
+            entry = frame_verify_pending.get(source_path)
+        if entry is None:
+            continue
+        destination = _frame_destination(source_path)
+        expected = entry["expected"] or _frame_digest(source_path)
+        actual = _frame_digest(destination, from_media=True)
+        with frame_verify_lock:
+            if expected is None:
+                frame_verify_pending.pop(source_path, None)  # source vanished meanwhile
+                continue
+            if actual == expected:
+                frame_verify_pending.pop(source_path, None)
+            else:
+                entry["attempts"] += 1
+                entry["busy"] = False
+        if actual == expected:
+            try:
+                os.remove(source_path)
+            except FileNotFoundError:
+                pass
+            continue
+
+        if entry["attempts"] >= FRAME_VERIFY_MAX_ATTEMPTS:
+            logging.error(
+                "verify: %s still differs after %d copies; keeping it on the ramdisk",
+                destination,
+                entry["attempts"],
+            )
+            with frame_verify_lock:
+                frame_verify_pending.pop(source_path, None)
+            continue
+        logging.warning("verify: %s does not match its source, copying again", destination)
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        try:
+            os.utime(source_path)  # lsyncd only copies what changed
+        except OSError:
+            pass
+
+def _frame_verifier_loop() -> None:
+    _apply_sched_role("analysis")
+    swept = False
+    while True:
+        time.sleep(FRAME_VERIFY_POLL_S)
+        if storage_location != 1 or not usb_mounted:
+            swept = False
+            continue
+        if not swept:
+            _sweep_ramdisk_for_verification()
+            swept = True
+        with frame_verify_lock:
+            waiting = [(path, entry) for path, entry in frame_verify_pending.items() if not entry["busy"]]
+        for source_path, entry in waiting:
+            if not os.path.exists(source_path):
+                with frame_verify_lock:
+                    frame_verify_pending.pop(source_path, None)
+                continue
+            # rsync renames its temp file into place, so the final name only shows up once copied.
+            if not os.path.exists(_frame_destination(source_path)):
+                continue
+            entry["busy"] = True
+            frame_verify_queue.put(source_path)
+
+def _start_frame_verifier() -> None:
+    global frame_verifier_running
+    if frame_verifier_running:
+        return
+    frame_verifier_running = True
+    for _ in range(FRAME_VERIFY_WORKERS):
+        threading.Thread(target=_frame_verify_worker, daemon=True).start()
+    threading.Thread(target=_frame_verifier_loop, daemon=True).start()
+
+
+# --- lsyncd config switching helpers ---
+def _atomic_symlink(target: str, link_path: str) -> None:
+    """Atomically replace link_path with a symlink to target."""
+    tmp_path = link_path + ".tmp"
+    try:
+        if os.path.islink(tmp_path) or os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    except FileNotFoundError:
+        pass
+    os.symlink(target, tmp_path)
+    os.replace(tmp_path, link_path)
+
+def _get_mount_device(mount_point: str) -> Optional[str]:
+    try:
+        with open("/proc/mounts", "r") as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1] == mount_point:
+                    return parts[0]
+    except Exception:
+        return None
+    return None
+
+def _get_block_device_name(device_path: str) -> Optional[str]:
+    if not device_path.startswith("/dev/"):
+        return None
+    name = os.path.basename(device_path)
+    if name.startswith("nvme") or name.startswith("mmcblk"):
+        return re.sub(r"p\d+$", "", name)
+    return re.sub(r"\d+$", "", name)
+
+def _find_usb_speed(block_device: str) -> Optional[float]:
+    sys_path = os.path.realpath(os.path.join("/sys/class/block", block_device))
+    current = sys_path
+    while True:
+        speed_path = os.path.join(current, "speed")
+        if os.path.isfile(speed_path):
+            try:
+                with open(speed_path, "r") as file:
+                    return float(file.read().strip())
+            except Exception:
+                return None
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    return None
+
+class PowerEvent(enum.Enum):
+    OVER_CURRENT = "over-current"
+    UNDER_VOLTAGE = "under-voltage"
+    INSUFFICIENT_POWER = "insufficient power"
+
+def _classify_power_message(message: str) -> Optional[PowerEvent]:
+    lower = message.lower()
+    if "over-current" in lower:
+        return PowerEvent.OVER_CURRENT
+    if "undervoltage" in lower or "under-voltage" in lower:
+        return PowerEvent.UNDER_VOLTAGE
+    if "insufficient power" in lower:
+        return PowerEvent.INSUFFICIENT_POWER
+    return None
+
+def _parse_kmsg_record(record: bytes):
+    """Split a /dev/kmsg record ("prio,seq,usec,flags;message") into (usec, message)."""
+    header, sep, body = record.decode("utf-8", "replace").partition(";")
+    if not sep:
+        return None
+    fields = header.split(",")
+    if len(fields) < 3:
+        return None
+    try:
+        timestamp_us = int(fields[2])
+    except ValueError:
+        return None
+    # Continuation lines (" KEY=value") carry device metadata we don't need.
+    return timestamp_us, body.split("\n", 1)[0].strip()
+
+def _kmsg_monitor_loop(fd: int, since_us: int) -> None:
+    global kmsg_monitor_running
+    try:
+        while not shutting_down:
+            try:
+                record = os.read(fd, 8192)  # one record per read, blocks until the next one
+            except OSError as exc:
+                if exc.errno == errno.EPIPE:
+                    continue  # ring buffer overwrote records we had not read yet
+                raise
+            parsed = _parse_kmsg_record(record)
+            if parsed is None:
+                continue
+            timestamp_us, message = parsed
+            if timestamp_us < since_us:
+                continue
+            kind = _classify_power_message(message)
+            if kind is None:
+                continue
+            logging.warning("power: %s at [%.6f] %s", kind.value, timestamp_us / 1_000_000, message)
+            power_events.append((kind, timestamp_us, datetime.now(), message))
+    except Exception as exc:
+        logging.exception("power: kmsg monitor failed, falling back to dmesg polling: %s", exc)
+    finally:
+        kmsg_monitor_running = False
+        os.close(fd)
+
+def _start_kmsg_monitor() -> None:
+    global kmsg_monitor_running
+    try:
+        fd = os.open("/dev/kmsg", os.O_RDONLY)
+    except OSError as exc:
+        logging.warning("power: cannot read /dev/kmsg (%s); polling dmesg instead", exc)
+        return
+    # Same window as `dmesg --since <scanner start>`: kmsg timestamps are CLOCK_MONOTONIC.
+    since_us = int(time.clock_gettime(time.CLOCK_MONOTONIC) * 1_000_000)
+    kmsg_monitor_running = True
+    threading.Thread(target=_kmsg_monitor_loop, args=(fd, since_us), name="kmsg-monitor", daemon=True).start()
+
+def _dmesg_power_warning() -> Optional[str]:
+    args = ["dmesg"]
+    if dmesg_since:
+        args.extend(["--since", dmesg_since])
+    result = subprocess.run(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None
+    for line in result.stdout.splitlines():
+        if _classify_power_message(line) is not None:
+            return line.strip()
+    return None
+
+def _check_usb_power_warning() -> None:
+    global last_usb_power_check, usb_power_warning_logged, power_warning_active
+    if kmsg_monitor_running:
+        # Events are pushed by the kmsg monitor as they happen, checking them costs nothing.
+        warning_line = None
+        while power_events:
+            _kind, _timestamp_us, _seen_at, message = power_events.popleft()
+            warning_line = warning_line or message
+    else:
+        now = time.monotonic()
+        if now - last_usb_power_check < USB_POWER_CHECK_INTERVAL_S:
+            return
+        last_usb_power_check = now
+        warning_line = _dmesg_power_warning()
+    if not usb_power_warning_logged and warning_line:
+        logging.warning("Detected USB power warning in dmesg: %s", warning_line)
+        usb_power_warning_logged = True
+        power_warning_active = True
+    if power_warning_active and not sleep_mode:
+        if state.scanning:
+            state.stop_scan()
+        if current_screen != "too-much-power":
+            show_screen("too-much-power")
+
+def _check_usb3_speed_warning() -> None:
+    global last_usb_speed_check, usb_speed_warning_logged, usb3_warning_active
+    if storage_monitor_running:
+        # The storage monitor keeps the link speed cached until the device changes.
+        if not usb_mounted:
+            return
+        speed = usb_link_speed
+    else:
+        now = time.monotonic()
+        if now - last_usb_speed_check < USB3_CHECK_INTERVAL_S:
+            return
+        last_usb_speed_check = now
+        if not os.path.ismount(USB_MOUNT_POINT):
+            return
+        mount_device = _get_mount_device(USB_MOUNT_POINT)
+        if not mount_device:
+            return
+        block_device = _get_block_device_name(mount_device)
+        if not block_device:
+            return
+        speed = _find_usb_speed(block_device)
+    if speed is None:
+        return
+    if speed >= 1000.0:
+        usb_speed_warning_logged = False
+        if usb3_warning_active:
+            usb3_warning_active = False
+            if current_screen == "no-usb3-drive":
+                if last_status_screen:
+                    show_screen(last_status_screen)
+                else:
+                    show_ready_to_scan()
+        return
+    if not usb_speed_warning_logged:
+        logging.warning(
+            "USB drive at /mnt/usb is running at %.0fMbit/s (USB3 is 5000M).",
+            speed,
+        )
+        usb_speed_warning_logged = True
+    usb3_warning_active = True
+    if not sleep_mode and not power_warning_active and current_screen != "no-usb3-drive":
+        show_screen("no-usb3-drive")
+
+# --- thermal governor ---
+def _read_soc_temperature() -> Optional[float]:
+    try:
+        with open(THERMAL_ZONE_PATH, "r") as file:
+            return int(file.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+def _read_throttled_flags(use_vcgencmd: bool) -> Optional[int]:
+    """Same bits as `vcgencmd get_throttled`, read from sysfs when the kernel exposes them."""
+    try:
+        with open(THROTTLED_SYSFS_PATH, "r") as file:
+            return int(file.read().strip(), 16)
+    except (OSError, ValueError):
+        pass
+    if not use_vcgencmd:
+        return None
+    try:
+        result = subprocess.run(
+            ["/usr/bin/vcgencmd", "get_throttled"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=False,
+            timeout=2.0,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"throttled=(0x[0-9a-fA-F]+)", result.stdout)
+    return int(match.group(1), 16) if match else None
+
+def _thermal_pace_delay(temperature: Optional[float], slope: float, throttled: Optional[int]) -> float:
+    if throttled is not None and throttled & (THROTTLE_THROTTLED | THROTTLE_FREQ_CAPPED | THROTTLE_SOFT_TEMP_LIMIT):
+        return THERMAL_MAX_PACE_DELAY_S
+    if temperature is None:
+        return 0.0
+    projected = temperature + max(0.0, slope) * THERMAL_LOOKAHEAD_S
+    fraction = (projected - THERMAL_PACE_START_C) / (THERMAL_PACE_FULL_C - THERMAL_PACE_START_C)
+    return THERMAL_MAX_PACE_DELAY_S * min(1.0, max(0.0, fraction))
+
+def _thermal_governor_loop() -> None:
+    global soc_temperature, soc_throttled, thermal_pace_delay_s
+    slope = 0.0
+    last_vcgencmd = 0.0
+    while not shutting_down:
+        try:
+            now = time.monotonic()
+            use_vcgencmd = now - last_vcgencmd >= THERMAL_VCGENCMD_INTERVAL_S
+            temperature = _read_soc_temperature()
+            throttled = _read_throttled_flags(use_vcgencmd)
+            if use_vcgencmd:
+                last_vcgencmd = now
+            if throttled is None:
+                throttled = soc_throttled
+            if temperature is not None and soc_temperature is not None:
+                # Exponential moving average of °C/s; single readings are too noisy.
+                slope = 0.8 * slope + 0.2 * (temperature - soc_temperature) / THERMAL_SAMPLE_INTERVAL_S
+            delay = _thermal_pace_delay(temperature, slope, throttled)
+            if throttled != soc_throttled and throttled is not None:
+                logging.info("thermal: throttle flags 0x%x (temp %.1f°C)", throttled, temperature or 0.0)
+            if (delay > 0.0) != (thermal_pace_delay_s > 0.0):
+                if delay > 0.0:
+                    logging.warning(
+                        "thermal: pacing scan by %.0fms (temp %.1f°C, %+.2f°C/s)",
+                        delay * 1000,
+                        temperature or 0.0,
+                        slope,
+                    )
+                else:
+                    logging.info("thermal: pacing off (temp %.1f°C)", temperature or 0.0)
+            soc_temperature = temperature
+            soc_throttled = throttled
+            thermal_pace_delay_s = delay
+        except Exception as exc:
+            logging.warning("thermal: reading the SoC state failed: %s", exc)
+        sleep(THERMAL_SAMPLE_INTERVAL_S)
+
+def _start_thermal_governor() -> None:
+    threading.Thread(target=_thermal_governor_loop, name="thermal-governor", daemon=True).start()
+
+def _format_thermal_state() -> str:
+    temperature = f"{soc_temperature:.1f}°C" if soc_temperature is not None else "n/a"
+    throttled = f"0x{soc_throttled:x}" if soc_throttled is not None else "n/a"
+    return f"{temperature} throttled={throttled}"
+
+def _read_user_and_host() -> Optional[str]:
+    try:
+        with open(".user_and_host", "r") as file:
+            return file.read().strip()
+    except Exception:
+        return None
+
+def _read_scan_destination() -> Optional[str]:
+    try:
+        with open(".scan_destination", "r") as file:
+            return file.read().strip()
+    except Exception:
+        return None
+
+def _read_host_path() -> Optional[str]:
+    try:
+        with open(".host_path", "r") as file:
+            return file.read().strip()
+    except Exception:
+        return None
+
+def _run_avrdude(*operations: str, timeout_s: float) -> Optional[subprocess.CompletedProcess]:
+    try:
+        return subprocess.run(
+            [
+                MCU_AVRDUDE,
+                "-C",
+                MCU_AVRDUDE_CONF,
+                "-p",
+                "atmega328p",
+                "-c",
+                "raspberry_pi_gpio",
+                "-P",
+                "gpiochip0",
+                *operations,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout_s,
+        )
+    except subprocess.TimeoutExpired:
+        logging.error("mcu: avrdude timed out after %.0fs", timeout_s)
+        return None
+
+def _read_mcu_signature() -> Optional[str]:
+    # Without -U operations avrdude only enters programming mode and reads the device signature.
+    result = _run_avrdude(timeout_s=MCU_SIGNATURE_TIMEOUT_S)
+    if result is None:
+        return None
+    match = re.search(r"Device signature = (0x[0-9a-fA-F]+)", result.stderr + result.stdout)
+    if result.returncode != 0 or not match:
+        logging.warning("mcu: signature read failed (code=%s): %s", result.returncode, result.stderr.strip())
+        return None
+    return match.group(1).lower()
+
+def _record_mcu_verification(hex_digest: Optional[str], signature: Optional[str], duration_s: Optional[float]) -> None:
+    if not hex_digest or not signature:
+        _update_startup_cache(mcu_firmware=None)
+        return
+    previous = startup_cache.get("mcu_firmware") or {}
+    _update_startup_cache(mcu_firmware={
+        "hex_sha256": hex_digest,
+        "signature": signature,
+        "verified_at": datetime.now().isoformat(timespec="seconds"),
+        "verify_duration_s": duration_s if duration_s is not None else previous.get("verify_duration_s"),
+    })
+
+def _verify_mcu_firmware() -> bool:
+    """Returns True if the MCU needs to be flashed.
+
+    A full flash read-back only runs if the hex, the device signature or a forced verify asks
+    for it. Otherwise the verification record from the last boot plus a signature read is enough.
+    """
+    global mcu_flash_checked, mcu_flash_error
+    if mcu_flash_checked:
+        return False
+    mcu_flash_checked = True
+    logging.info("mcu: starting firmware verify")
+    if not os.path.isfile(MCU_HEX_PATH):
+        mcu_flash_error = f"missing hex: {MCU_HEX_PATH}"
+        logging.error("mcu: %s", mcu_flash_error)
+        return False
+    if not os.path.isfile(MCU_AVRDUDE_CONF):
+        mcu_flash_error = f"missing avrdude config: {MCU_AVRDUDE_CONF}"
+        logging.error("mcu: %s", mcu_flash_error)
+        return False
+    if not os.path.isfile(MCU_AVRDUDE):
+        mcu_flash_error = f"missing avrdude: {MCU_AVRDUDE}"
+        logging.error("mcu: %s", mcu_flash_error)
+        return False
+    hex_digest = _file_sha256(MCU_HEX_PATH)
+    signature_started_at = time.monotonic()
+    signature = _read_mcu_signature()
+    signature_duration = time.monotonic() - signature_started_at
+    record = startup_cache.get("mcu_firmware") or {}
+    if force_mcu_verify:
+        logging.info("mcu: full verify forced")
+    elif not hex_digest or not signature:
+        logging.info("mcu: no hex digest or signature, running full verify")
+    elif record.get("hex_sha256") != hex_digest:
+        logging.info("mcu: hex changed since last verify (sha256 %s), running full verify", hex_digest[:12])
+    elif record.get("signature") != signature:
+        logging.info(
+            "mcu: device signature changed (%s -> %s), running full verify",
+            record.get("signature"),
+            signature,
+        )
+    else:
+        saved = record.get("verify_duration_s")
+        if saved:
+            logging.info(
+                "mcu: hex and signature %s unchanged since %s; skipped full verify, saved %.1fs",
+                signature,
+                record.get("verified_at"),
+                max(0.0, saved - signature_duration),
+            )
+        else:
+            logging.info("mcu: hex and signature %s unchanged since %s; skipped full verify", signature, record.get("verified_at"))
+        return False
+    verify_started_at = time.monotonic()
+    result = _run_avrdude("-U", f"flash:v:{MCU_HEX_PATH}:i", timeout_s=MCU_VERIFY_TIMEOUT_S)
+    verify_duration = time.monotonic() - verify_started_at
+    if result is None:
+        mcu_flash_error = "verify timed out"
+        return False
+    if result.returncode == 0:
+        logging.info("mcu: firmware already matches expected hex (verify took %.1fs)", verify_duration)
+        _record_mcu_verification(hex_digest, signature, verify_duration)
+        return False
+    else:
+        logging.warning("mcu: firmware mismatch detected (code=%s)", result.returncode)
+        if result.stderr:
+            logging.info("mcu: verify stderr: %s", result.stderr.strip())
+        _record_mcu_verification(None, None, None)
+        return True
+
+def _run_mcu_flash_if_needed():
+    global mcu_flash_in_progress, mcu_flash_error
+    if mcu_flash_in_progress:
+        return
+    if not os.path.isfile(MCU_FLASH_SCRIPT):
+        mcu_flash_error = f"missing flash script: {MCU_FLASH_SCRIPT}"
+        logging.error("mcu: %s", mcu_flash_error)
+        return
+    mcu_flash_in_progress = True
+    logging.info("mcu: flashing start")
+    show_screen("updating-ino")
+    result = subprocess.run(
+        ["bash", MCU_FLASH_SCRIPT],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if result.stdout:
+        logging.info("mcu: flash stdout: %s", result.stdout.strip())
+    if result.stderr:
+        logging.info("mcu: flash stderr: %s", result.stderr.strip())
+    if result.returncode == 0:
+        logging.info("mcu: flashing completed")
+        # The flash script verifies after writing, so this hex is known to be on the MCU now.
+        _record_mcu_verification(_file_sha256(MCU_HEX_PATH), _read_mcu_signature(), None)
+    else:
+        logging.error("mcu: flashing failed (code=%s)", result.returncode)
+    mcu_flash_in_progress = False
+    if last_status_screen:
+        show_screen(last_status_screen)
+    else:
+        show_ready_to_scan()
+
+def _ensure_usb_mount() -> bool:
+    if os.path.ismount("/mnt/usb"):
+        return True
+    if sleep_mode:
+        return False
+    disk = None
     for _ in range(10):
         disk = _find_usb_disk_name()
         if disk:
@@ -1657,75 +4115,316 @@ def _find_usb_disk_name() -> Optional[str]:
             return name
     return None
 
+# --- storage manager ---
+# Hotplug (kernel uevents) and mount table changes (/proc/self/mounts polls POLLPRI) wake a
+# single background thread, which keeps the mount state, block device and USB link speed
+# cached. Everything else reads the cache and never blocks on a drive appearing.
+def _usb_is_mounted() -> bool:
+    if storage_monitor_running:
+        return usb_mounted
+    return os.path.ismount(USB_MOUNT_POINT)
+
+def _wait_for_storage_change(generation: int, timeout_s: float) -> int:
+    """Block until the storage state changed after `generation` or timeout. Returns the new generation."""
+    with storage_changed:
+        storage_changed.wait_for(lambda: storage_generation != generation, timeout=timeout_s)
+        return storage_generation
+
+def _refresh_usb_state(reason: str) -> None:
+    global usb_mounted, usb_block_device, usb_link_speed, storage_generation
+    mounted = os.path.ismount(USB_MOUNT_POINT)
+    block_device = None
+    if mounted:
+        mount_device = _get_mount_device(USB_MOUNT_POINT)
+        if mount_device:
+            block_device = _get_block_device_name(mount_device)
+    link_speed = usb_link_speed
+    if block_device != usb_block_device:
+        # Only walk sysfs when the device behind the mount point actually changed.
+        link_speed = _find_usb_speed(block_device) if block_device else None
+    if (mounted, block_device, link_speed) == (usb_mounted, usb_block_device, usb_link_speed):
+        return
+    logging.info(
+        "storage: %s mounted=%s device=%s speed=%s (%s)",
+        USB_MOUNT_POINT,
+        mounted,
+        block_device,
+        f"{link_speed:.0f}M" if link_speed is not None else "n/a",
+        reason,
+    )
+    with storage_changed:
+        usb_mounted = mounted
+        usb_block_device = block_device
+        usb_link_speed = link_speed
+        storage_generation += 1
+        storage_changed.notify_all()
+
+def _parse_uevent(data: bytes) -> dict:
+    fields = data.split(b"\0")
+    event = {}
+    for field in fields[1:]:
+        key, sep, value = field.partition(b"=")
+        if sep:
+            event[key.decode("ascii", "replace")] = value.decode("utf-8", "replace")
+    return event
+
+def _open_uevent_socket() -> Optional[socket.socket]:
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        sock.bind((0, 1))  # multicast group 1: kernel uevents
+        sock.setblocking(False)
+        return sock
+    except OSError as exc:
+        logging.warning("storage: cannot open uevent netlink socket (%s); polling instead", exc)
+        return None
+
+def _storage_monitor_loop() -> None:
+    global storage_monitor_running
+    uevents = _open_uevent_socket()
+    mounts = open("/proc/self/mounts", "rb")
+    poller = select.poll()
+    poller.register(mounts.fileno(), select.POLLPRI | select.POLLERR)
+    if uevents is not None:
+        poller.register(uevents.fileno(), select.POLLIN)
+    _refresh_usb_state("initial")
+    storage_monitor_running = True
+    try:
+        while not shutting_down:
+            # Without the netlink socket, the 1s timeout degrades this to the old polling.
+            ready = poller.poll(1000 if uevents is None else 5000)
+            reason = None
+            for fd, _mask in ready:
+                if fd == mounts.fileno():
+                    mounts.seek(0)
+                    mounts.read()
+                    reason = "mount table changed"
+                elif uevents is not None and fd == uevents.fileno():
+                    while True:
+                        try:
+                            data = uevents.recv(65536)
+                        except BlockingIOError:
+                            break
+                        event = _parse_uevent(data)
+                        if event.get("SUBSYSTEM") != "block":
+                            continue
+                        reason = f"uevent {event.get('ACTION')} {event.get('DEVNAME')}"
+                        if event.get("ACTION") == "remove" and event.get("DEVNAME") == usb_block_device:
+                            _refresh_usb_state(reason)
+                        if (
+                            event.get("ACTION") == "add"
+                            and event.get("DEVTYPE") == "disk"
+                            and storage_location == 1
+                        ):
+                            _request_usb_mount()
+            if reason is not None or uevents is None:
+                _refresh_usb_state(reason or "poll")
+    except Exception as exc:
+        logging.exception("storage: monitor failed, falling back to polling: %s", exc)
+    finally:
+        storage_monitor_running = False
+        mounts.close()
+        if uevents is not None:
+            uevents.close()
+
+def _start_storage_monitor() -> None:
+    threading.Thread(target=_storage_monitor_loop, name="storage-monitor", daemon=True).start()
+
+def _request_usb_mount() -> None:
+    """Mount the USB drive in the background; the storage monitor picks up the result."""
+    global usb_mount_requested
+    if usb_mount_requested or _usb_is_mounted() or sleep_mode:
+        return
+    usb_mount_requested = True
+
+    def _mount():
+        global usb_mount_requested
+        try:
+            _ensure_usb_mount()
+        finally:
+            usb_mount_requested = False
+
+    threading.Thread(target=_mount, name="usb-mount", daemon=True).start()
+
+# --- network supervisor ---
+# In remote mode a background thread keeps a multiplexed ssh master connection to the paired
+# host and a cached reachability/writability state. Callers read the cache instead of pinging
+# and opening fresh ssh connections on their own thread; lsyncd reuses the same ControlPath.
+def _ssh_args(user_and_host: str, *options: str) -> list:
+    return [
+        "ssh",
+        "-i",
+        SSH_IDENTITY_FILE,
+        "-o",
+        "BatchMode=yes",
+        "-o",
+        "ConnectTimeout=5",
+        "-o",
+        f"ControlPath={SSH_CONTROL_PATH}",
+        *options,
+        user_and_host,
+    ]
+
+def _ensure_ssh_master(user_and_host: str, host: str) -> bool:
+    """Returns True if the host is reachable, (re)starting the shared ssh master if needed."""
+    check = subprocess.run(
+        _ssh_args(user_and_host, "-O", "check"),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if check.returncode == 0:
+        return True
+    result = subprocess.run(
+        ["ping", "-c", "1", "-W", "1", host],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        return False
+    # -f backgrounds the master after authentication; no pipes, so nothing waits on it.
+    master = subprocess.run(
+        _ssh_args(
+            user_and_host,
+            "-M",
+            "-N",
+            "-f",
+            "-o",
+            f"ControlPersist={SSH_CONTROL_PERSIST_S}",
+            "-o",
+            "ServerAliveInterval=5",
+            "-o",
+            "ServerAliveCountMax=2",
+        ),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if master.returncode != 0:
+        # Answers ping but not ssh (sshd down, key revoked): lsyncd couldn't ship anything either.
+        logging.info("network: ssh master to %s failed: %s", user_and_host, master.stderr.strip())
+        return False
+    logging.info("network: ssh master to %s established", user_and_host)
+    return True
+
 def _can_write_remote_path(user_and_host: str, scan_destination: str) -> bool:
     probe_path = os.path.join(scan_destination, ".filmkorn_write_test")
     quoted_probe = shlex.quote(probe_path)
     remote_cmd = f"touch {quoted_probe} && rm -f {quoted_probe}"
     result = subprocess.run(
-        [
-            "ssh",
-            "-i",
-            "/home/pi/.ssh/id_filmkorn-scanner_ed25519",
-            user_and_host,
-            remote_cmd,
-        ],
+        _ssh_args(user_and_host, "-o", "ControlMaster=no") + [remote_cmd],
+        stdin=subprocess.DEVNULL,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True,
     )
-    logging.info(
+    logging.debug(
         "lsyncd: remote write probe to %s:%s -> %s",
         user_and_host,
         probe_path,
         result.returncode,
     )
-    if result.stderr:
+    if result.returncode != 0 and result.stderr:
         logging.info("lsyncd: remote write probe stderr: %s", result.stderr.strip())
     return result.returncode == 0
 
+def _network_target_ready() -> bool:
+    return bool(network_state["reachable"] and network_state["writable"])
+
+def _network_problem_screen() -> str:
+    if not network_state["reachable"]:
+        return "cannot-connect-to-paired-mac"
+    return "target-dir-does-not-exist"
+
+def _wait_for_network_state(timeout_s: float) -> None:
+    with network_state_changed:
+        network_state_changed.wait_for(lambda: network_state["checked_at"] > 0.0, timeout=timeout_s)
+
+def _publish_network_state(user_and_host: Optional[str], reachable: bool, writable: Optional[bool]) -> None:
+    global pending_net_switch
+    now = time.monotonic()
+    changed = (
+        (user_and_host, reachable, writable)
+        != (network_state["user_and_host"], network_state["reachable"], network_state["writable"])
+    )
+    with network_state_changed:
+        network_state["user_and_host"] = user_and_host
+        network_state["reachable"] = reachable
+        network_state["writable"] = writable
+        network_state["checked_at"] = now
+        if changed:
+            network_state["changed_at"] = now
+        network_state_changed.notify_all()
+    if changed:
+        logging.info("network: %s reachable=%s writable=%s", user_and_host, reachable, writable)
+    if storage_location != 0 or shutting_down or state.scanning:
+        return
+    if _network_target_ready():
+        if pending_net_switch:
+            pending_net_switch = False
+            switch_lsyncd_config(0)
+        if changed and current_screen in {"cannot-connect-to-paired-mac", "target-dir-does-not-exist"}:
+            show_ready_to_scan()
+    elif changed and current_screen in {"ready-to-scan-net", "cannot-connect-to-paired-mac", "target-dir-does-not-exist"}:
+        show_screen(_network_problem_screen())
+
+def _network_supervisor_loop() -> None:
+    last_write_probe = 0.0
+    while not shutting_down:
+        user_and_host = _read_user_and_host()
+        if storage_location != 0 or not user_and_host or sleep_mode:
+            sleep(NETWORK_IDLE_INTERVAL_S)
+            continue
+        scan_destination = _read_scan_destination()
+        host = user_and_host.split("@", 1)[-1]
+        reachable = _ensure_ssh_master(user_and_host, host)
+        writable = network_state["writable"] if reachable else False
+        now = time.monotonic()
+        if reachable and (
+            not writable
+            or user_and_host != network_state["user_and_host"]
+            or now - last_write_probe >= NETWORK_WRITE_CHECK_INTERVAL_S
+        ):
+            writable = _can_write_remote_path(user_and_host, scan_destination) if scan_destination else True
+            last_write_probe = now
+        _publish_network_state(user_and_host, reachable, writable)
+        sleep(NETWORK_CHECK_INTERVAL_S if reachable and writable else 1.0)
+
+def _start_network_supervisor() -> None:
+    threading.Thread(target=_network_supervisor_loop, name="network-supervisor", daemon=True).start()
+
 def switch_lsyncd_config(storage_location: int) -> None:
     """
     Switch lsyncd config via the lsyncd.active.conf symlink and restart lsyncd.
 
       - 1 => HDD / local USB (exFAT) target
       - 0 => Net / remote target
+
+    In remote mode this never waits on the network; if the host is not ready yet, the
+    network supervisor performs the switch once it is.
     """
+    global pending_net_switch
     target_conf = LSYNCD_CONF_LOCAL if storage_location == 1 else LSYNCD_CONF_NET
     try:
-        if target_conf == LSYNCD_CONF_LOCAL and not os.path.ismount("/mnt/usb"):
+        if target_conf == LSYNCD_CONF_LOCAL and not _usb_is_mounted():
             if current_screen != "no-drive-connected":
                 show_screen("no-drive-connected")
-            while not os.path.ismount("/mnt/usb"):
-                sleep(1)
+            generation = storage_generation
+            while not _usb_is_mounted():
+                generation = _wait_for_storage_change(generation, 1.0)
         if target_conf == LSYNCD_CONF_NET:
-            user_and_host = _read_user_and_host()
-            host = user_and_host.split("@", 1)[-1] if user_and_host else None
-            scan_destination = _read_scan_destination()
-            if host:
-                logging.info(
-                    "lsyncd: checking host=%s user_and_host=%s scan_destination=%s",
-                    host,
-                    user_and_host,
-                    scan_destination,
-                )
-                while True:
-                    result = subprocess.run(
-                        ["ping", "-c", "1", "-W", "1", host],
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
+            pending_net_switch = False
+            if _read_user_and_host():
+                if network_state["checked_at"] == 0.0:
+                    _wait_for_network_state(NETWORK_FIRST_CHECK_TIMEOUT_S)
+                if not _network_target_ready():
+                    logging.info(
+                        "lsyncd: remote target not ready (reachable=%s writable=%s), switching later",
+                        network_state["reachable"],
+                        network_state["writable"],
                     )
-                    logging.info("lsyncd: ping %s -> %s", host, result.returncode)
-                    if result.returncode != 0:
-                        show_screen("cannot-connect-to-paired-mac")
-                        sleep(1)
-                        continue
-                    if user_and_host and scan_destination:
-                        if _can_write_remote_path(user_and_host, scan_destination):
-                            break
-                        show_screen("target-dir-does-not-exist")
-                        sleep(1)
-                        continue
-                    break
+                    pending_net_switch = True
+                    show_screen(_network_problem_screen())
+                    return
         _atomic_symlink(target_conf, LSYNCD_ACTIVE_CONF)
         logging.info(f"lsyncd: set active config -> {target_conf}")
         # Requires sudoers rule for pi to restart lsyncd without password.
@@ -1734,6 +4433,163 @@ def switch_lsyncd_config(storage_location: int) -> None:
     except Exception as e:
         logging.exception(f"lsyncd: failed to switch config to {target_conf}: {e}")
 
+# --- link bandwidth probe ---
+def _scan_profile_key(resolution: str, compressed: bool) -> str:
+    return f"{resolution}-lj92" if compressed else resolution
+
+def _current_resolution() -> str:
+    return "2K" if current_resolution_switch == 1 else "4K"
+
+def _bandwidth_target_key() -> Optional[str]:
+    if storage_location == 1:
+        if not _usb_is_mounted():
+            return None
+        try:
+            return f"usb:{os.statvfs(USB_MOUNT_POINT).f_fsid:x}"
+        except OSError:
+            return None
+    user_and_host = _read_user_and_host()
+    if storage_location == 0 and user_and_host and _network_target_ready():
+        return f"net:{user_and_host}:{_read_scan_destination() or ''}"
+    return None
+
+def _probe_usb_bandwidth() -> Optional[float]:
+    probe_path = os.path.join(USB_MOUNT_POINT, ".filmkorn_bandwidth_probe")
+    chunk = os.urandom(BANDWIDTH_PROBE_CHUNK)  # incompressible, like raw frames
+    started_at = time.monotonic()
+    try:
+        with open(probe_path, "wb") as file:
+            for _ in range(BANDWIDTH_PROBE_BYTES // BANDWIDTH_PROBE_CHUNK):
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+    except OSError as exc:
+        logging.warning("bandwidth: usb probe failed: %s", exc)
+        return None
+    finally:
+        try:
+            os.remove(probe_path)
+        except OSError:
+            pass
+    return BANDWIDTH_PROBE_BYTES / (time.monotonic() - started_at)
+
+def _probe_net_bandwidth(user_and_host: str) -> Optional[float]:
+    chunk = os.urandom(BANDWIDTH_PROBE_CHUNK)
+    started_at = time.monotonic()
+    # Same path as rsync: ssh over the supervisor's master connection, no compression.
+    process = subprocess.Popen(
+        _ssh_args(user_and_host, "-o", "ControlMaster=no") + ["cat > /dev/null"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(BANDWIDTH_PROBE_BYTES // BANDWIDTH_PROBE_CHUNK):
+            process.stdin.write(chunk)
+        process.stdin.close()
+        returncode = process.wait(timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        logging.warning("bandwidth: network probe failed: %s", exc)
+        process.kill()
+        return None
+    if returncode != 0:
+        logging.warning("bandwidth: network probe exited with %s", returncode)
+        return None
+    return BANDWIDTH_PROBE_BYTES / (time.monotonic() - started_at)
+
+def _sustainable_fps(bytes_per_s: float, resolution: str, compressed: bool) -> float:
+    profiles = startup_cache.get("scan_profiles") or {}
+    profile = profiles.get(_scan_profile_key(resolution, compressed)) or {}
+    frame_bytes = profile.get("frame_bytes")
+    if not frame_bytes:
+        uncompressed = (profiles.get(resolution) or {}).get("frame_bytes") or DEFAULT_FRAME_BYTES[resolution]
+        frame_bytes = uncompressed * (DNG_COMPRESSION_RATIO_ESTIMATE if compressed else 1.0)
+    fps = bytes_per_s / frame_bytes
+    capture_fps = profile.get("fps")
+    if capture_fps:
+        fps = min(fps, capture_fps)
+    return fps
+
+def _update_link_summary() -> None:
+    global last_link_summary
+    key = _bandwidth_target_key()
+    entry = (startup_cache.get("bandwidth") or {}).get(key) if key else None
+    if not entry:
+        last_link_summary = None
+        return
+    bytes_per_s = entry["bytes_per_s"]
+    parts = [f"{bytes_per_s / 1e6:.0f} MB/s"]
+    for resolution, raw_fps, lj92_fps in _link_fps_table(bytes_per_s):
+        parts.append(f"{resolution} {raw_fps:.1f}|{lj92_fps:.1f}")
+    last_link_summary = " ".join(parts) + " fps"
+
+def _link_fps_table(bytes_per_s: float) -> list:
+    """(resolution, uncompressed fps, LJ92 fps) the link sustains for each resolution."""
+    return [
+        (resolution, _sustainable_fps(bytes_per_s, resolution, False), _sustainable_fps(bytes_per_s, resolution, True))
+        for resolution in ("4K", "2K")
+    ]
+
+def _bandwidth_probe_worker(key: str) -> None:
+    global bandwidth_probe_running
+    try:
+        logging.info("bandwidth: probing %s", key)
+        if key.startswith("usb:"):
+            bytes_per_s = _probe_usb_bandwidth()
+        else:
+            bytes_per_s = _probe_net_bandwidth(_read_user_and_host())
+        if bytes_per_s is None:
+            return
+        logging.info("bandwidth: %s sustained %.1f MB/s", key, bytes_per_s / 1e6)
+        for resolution, raw_fps, lj92_fps in _link_fps_table(bytes_per_s):
+            logging.info(
+                "bandwidth: %s sustains %.1f fps uncompressed, %.1f fps LJ92",
+                resolution,
+                raw_fps,
+                lj92_fps,
+            )
+        entries = dict(startup_cache.get("bandwidth") or {})
+        entries[key] = {"bytes_per_s": bytes_per_s, "measured_at": time.time()}
+        _update_startup_cache(bandwidth=entries)
+        _update_link_summary()
+        if not state.scanning:
+            _render_scan_overlay()
+    finally:
+        bandwidth_probe_running = False
+
+def _maybe_probe_bandwidth() -> None:
+    """Show the cached link summary for the active target, probing it in the background if stale."""
+    global bandwidth_probe_running
+    _update_link_summary()
+    key = _bandwidth_target_key()
+    if key is None or bandwidth_probe_running or state.scanning:
+        return
+    entry = (startup_cache.get("bandwidth") or {}).get(key)
+    if entry and time.time() - entry.get("measured_at", 0) < BANDWIDTH_PROBE_MAX_AGE_S:
+        return
+    bandwidth_probe_running = True
+    threading.Thread(target=_bandwidth_probe_worker, args=(key,), name="bandwidth-probe", daemon=True).start()
+
+def _record_scan_profile() -> None:
+    if not state.frames_written:
+        return
+    if state.fps_history:
+        avg_fps = sum(state.fps_history) / len(state.fps_history)
+    elif state.fps_count:
+        avg_fps = state.fps_sum / state.fps_count
+    else:
+        avg_fps = None
+    profiles = dict(startup_cache.get("scan_profiles") or {})
+    key = _scan_profile_key(_current_resolution(), dng_compress)
+    profiles[key] = {"frame_bytes": state.bytes_written / state.frames_written, "fps": avg_fps}
+    logging.info(
+        "bandwidth: %s frames average %.1f MB at %.1f fps",
+        key,
+        profiles[key]["frame_bytes"] / 1e6,
+        avg_fps or 0.0,
+    )
+    _update_startup_cache(scan_profiles=profiles)
+
 def get_available_disk_space():
     # Ensure RAW output directory exists
     try:
@@ -1800,25 +4656,42 @@ def set_init_values(arg_bytes):
 
 def set_zoom_mode_1_1(arg_bytes=None):
     state._zoom_mode = ZoomMode.Z1_1
+    _reset_focus_metric()
     set_auto_exposure(True)
     set_zoom_crop(0.0, 0.0, 1.0, 1.0)
     logging.info("Changing Preview Zoom Level to 1:1")
 
 def set_zoom_mode_3_1(arg_bytes=None):
     set_lamp_on()
-    state._zoom_mode = ZoomMode.Z1_1
+    state._zoom_mode = ZoomMode.Z3_1
+    _reset_focus_metric()
     set_auto_exposure(True)
     set_zoom_crop(1 / 3, 1 / 3, 1 / 3, 1 / 3)
     logging.info("Changing Preview Zoom Level to 3:1")
 
 def set_zoom_mode_10_1(arg_bytes=None):
     set_lamp_on()
-    state._zoom_mode = ZoomMode.Z1_1
+    state._zoom_mode = ZoomMode.Z10_1
+    _reset_focus_metric()
     set_auto_exposure(True)
     set_zoom_crop(0.42, 0.42, 1 / 6, 1 / 6)
     logging.info("Changing Preview Zoom Level to 6:1")
 
+def light_button_off(arg_bytes=None):
+    global lamp_is_on
+    lamp_is_on = False  # also while a calibration takes the press
+    if not _note_light_press(False):
+        set_lamp_off()
+
+def light_button_on(arg_bytes=None):
+    global lamp_is_on
+    lamp_is_on = True
+    if not _note_light_press(True):
+        set_lamp_on()
+
 def set_lamp_off(arg_bytes=None):
+    global lamp_is_on
+    lamp_is_on = False
     set_zoom_mode_1_1()
     set_auto_exposure(True)
     if last_status_screen in ("ready-to-scan", "ready-to-scan-local", "ready-to-scan-net"):
@@ -1830,6 +4703,9 @@ def set_lamp_off(arg_bytes=None):
     logging.info("Lamp turned off while keeping preview active")
 
 def set_lamp_on(arg_bytes=None):
+    global lamp_is_on
+    lamp_is_on = True
+    _reset_negative_preview()  # AE has to settle on the lit gate before the base is sampled
     set_zoom_crop(0.0, 0.0, 1.0, 1.0)
     camera_start()
     set_auto_exposure(True)
@@ -1837,8 +4713,9 @@ def set_lamp_on(arg_bytes=None):
     logging.info("Lamp turned on and camera preview enabled")
 
 def shoot_raw(arg_bytes=None):
+    _note_frame_start()
     camera_start()
-    if state.raws_path is None or not os.path.isdir(os.path.dirname(state.raws_path)):
+    if state.raws_path is None or not os.path.isdir(state.raws_path):
         logging.error("RAWs path inaccessible; stopping scan")
         state.stop_scan()
         return
@@ -1854,36 +4731,78 @@ def shoot_raw(arg_bytes=None):
                 finally:
                     warmup.release()
             state.warmup_needed = False
+            request = _capture_at_exposure(shutter_speed, attempts=5)
 
-            attempts = 5
-            for i in range(attempts):
-                candidate = camera.capture_request()
-                try:
-                    meta = candidate.get_metadata()
-                    exposure = meta.get("ExposureTime")
-                    tolerance = max(200, int(shutter_speed * 0.05))
-                    if exposure is not None and abs(exposure - shutter_speed) <= tolerance:
-                        request = candidate
-                        break
-                finally:
-                    if request is not candidate:
-                        candidate.release()
-
+        if request is None and hdr_brackets > 1:
+            # The base time was queued after the last bracket, but may not have reached the sensor yet.
+            request = _capture_at_exposure(shutter_speed)
         if request is None:
             request = camera.capture_request()
 
-        request.save_dng(state.raws_path.format(state.raw_count), name="raw")
+        blank_kind = None
+        brackets = None
+        if state.drop_first_frame and state.detect_crop:
+            state.detect_crop = False
+            _detect_session_crop(request)
+        if not state.drop_first_frame:
+            black = _raw_black_level(request.get_metadata())
+            planes = _raw_bayer_planes(request, RAW_SAMPLE_STEP)
+            blank_kind = _classify_blank_frame(planes, black)
+            _queue_exposure_stats(state.raw_count, planes, black)
+            if scene_cuts:
+                _queue_scene_sample(state.raw_count, planes, black)
+            if weave_roi is not None:
+                _queue_weave_sample(state.raw_count, request)
+        if blank_kind is None or blank_frame_mode == "keep":
+            tags = _calibration_tags(_current_resolution(), shutter_speed, state.crop)
+            if state.proxies and not state.drop_first_frame:
+                _queue_proxy(state.raw_count, request)
+            if hdr_brackets > 1 and not state.drop_first_frame:
+                raw_config = _cropped_raw_config(request.config["raw"], state.crop)
+                brackets = _capture_brackets(request, _hdr_exposures(shutter_speed), state.crop)
+            else:
+                _save_frame(
+                    lambda path: _save_raw_dng(request, path, state.crop),
+                    state.frame_path(state.raw_count),
+                    tags,
+                )
+        elif blank_frame_mode == "placeholder":
+            placeholder_path = _blank_placeholder_path(state.frame_path(state.raw_count))
+            os.makedirs(os.path.dirname(placeholder_path), exist_ok=True)
+            open(placeholder_path, "wb").close()
     finally:
         if request is not None:
             request.release()
-    if state.drop_first_frame and state.raw_count == 0:
+    if state.drop_first_frame:
         try:
-            os.remove(state.raws_path.format(0))
+            os.remove(state.frame_path(state.raw_count))
         except FileNotFoundError:
             pass
         state.drop_first_frame = False
         say_ready()
         return
+    frame_path = state.frame_path(state.raw_count)
+    frame_record = {"type": "frame", "index": state.raw_count, "size": None, "path": frame_path}
+    if blank_kind is not None:
+        state.blank_frames += 1
+        frame_record["blank"] = blank_kind
+        logging.info("Frame %d looks %s (%s)", state.raw_count, blank_kind, blank_frame_mode)
+    if brackets is not None:
+        # The HDR writer journals the frame once the merged DNG is in place.
+        _queue_hdr_merge(frame_record, brackets, raw_config, tags)
+    else:
+        if blank_kind is None or blank_frame_mode == "keep":
+            try:
+                frame_record["size"] = os.path.getsize(frame_path)
+                state.bytes_written += frame_record["size"]
+                state.frames_written += 1
+            except OSError:
+                pass
+        else:
+            frame_record.update(size=0, path=None)
+            if blank_frame_mode == "placeholder":
+                _enqueue_frame_verification(_blank_placeholder_path(frame_path))
+        _journal_append(frame_record)
     state.raw_count += 1
     elapsed_time = time.time() - start_time
     fps = 1 / elapsed_time if elapsed_time > 0 else 0.0
@@ -1896,15 +4815,25 @@ def shoot_raw(arg_bytes=None):
         state.fps_count += 1
         avg_fps = state.fps_sum / state.fps_count
         avg_count = state.fps_count
-    logging.info(
-        "One raw with shutter speed %s taken and saved in %.2fs, avg %.1ffps (count %d)",
-        _format_shutter_speed(shutter_speed),
-        elapsed_time,
-        avg_fps,
-        avg_count,
-    )
+    if _log_frame(state.raw_count - 1):
+        logging.info(
+            "One raw with shutter speed %s taken and saved in %.2fs, avg %.1ffps (count %d), %s",
+            _format_shutter_speed(shutter_speed),
+            elapsed_time,
+            avg_fps,
+            avg_count,
+            _format_thermal_state(),
+        )
+    if soc_temperature is not None:
+        state.max_temperature = max(state.max_temperature or soc_temperature, soc_temperature)
+    if soc_throttled and soc_throttled & (THROTTLE_THROTTLED | THROTTLE_FREQ_CAPPED):
+        state.throttled_frames += 1
     update_fps_overlay(avg_fps)
     update_shutter_overlay(shutter_speed)
+    if thermal_pace_delay_s > 0.0:
+        # Slow down the controller's frame advance before the SoC throttles itself.
+        state.paced_frames += 1
+        sleep(thermal_pace_delay_s)
     say_ready()
 
 def set_exposure(arg_bytes):
@@ -1919,46 +4848,376 @@ def set_exposure(arg_bytes):
 
 def say_ready():
     tell_arduino(Command.READY)
-    logging.debug("Told Arduino we are ready for next image")
+    if not state.scanning or _log_frame(state.raw_count - 1):
+        logging.debug("Told Arduino we are ready for next image")
 
 
-# Now let's go
-def setup():
-    global PID_FILE_PATH, arduino, arduino_i2c_address, ssh_subprocess, state, camera, storage_location, sensor_size, preview_size, overlay_ready, overlay_supported, overlay_retry_count, overlay_retry_timer, current_resolution_switch, last_resolution_label, last_sleep_button_state, last_sleep_button_change, sleep_button_armed, dmesg_since, current_version_label
-    os.chdir("/home/pi/Filmkorn-Raw-Scanner/raspi")
-    
-    atexit.register(cleanup_terminal)
-    clear_tty1()
+# --- startup orchestration ---
+def _load_startup_cache() -> dict:
+    try:
+        with open(STARTUP_CACHE_PATH, "r") as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except Exception as exc:
+        logging.warning("startup: ignoring unreadable cache %s: %s", STARTUP_CACHE_PATH, exc)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def _update_startup_cache(**values) -> None:
+    with startup_cache_lock:
+        startup_cache.update(values)
+        tmp_path = STARTUP_CACHE_PATH + ".tmp"
+        try:
+            with open(tmp_path, "w") as file:
+                json.dump(startup_cache, file, indent=2, sort_keys=True)
+            os.replace(tmp_path, STARTUP_CACHE_PATH)
+        except Exception as exc:
+            logging.warning("startup: failed to write cache %s: %s", STARTUP_CACHE_PATH, exc)
 
-    # set up logging (file + stdout so journalctl includes full detail)
-    logging.root.handlers.clear()
-    file_handler = logging.FileHandler("scanner.log")
+def _file_sha256(path: str) -> Optional[str]:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def _start_startup_step(name: str, label: str, target, *args) -> None:
+    step = {
+        "label": label,
+        "started_at": time.monotonic(),
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+
+    def _run():
+        try:
+            step["result"] = target(*args)
+        except Exception as exc:
+            step["error"] = exc
+            logging.exception("startup: step %s failed: %s", name, exc)
+        finally:
+            step["finished_at"] = time.monotonic()
+            logging.info("startup: %s finished in %.2fs", name, step["finished_at"] - step["started_at"])
+
+    startup_steps[name] = step
+    threading.Thread(target=_run, name=f"startup-{name}", daemon=True).start()
+
+def _show_startup_progress() -> None:
+    global startup_progress_key
+    if not preview_started or current_screen not in (None, "update"):
+        return
+    lines = ["Starting scanner", ""]
+    for step in startup_steps.values():
+        if step["finished_at"] is None:
+            status = "..."
+        elif step["error"] is not None:
+            status = "failed"
+        else:
+            status = "done"
+        lines.append(f"{step['label']}: {status}")
+    key = "|".join(lines)
+    if key == startup_progress_key:
+        return
+    startup_progress_key = key
+    show_update_screen(lines)
+
+def _wait_startup_steps(names, timeout_s: float) -> bool:
+    """Wait for the named startup steps, updating the progress screen. Returns False on timeout."""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        _show_startup_progress()
+        pending = [name for name in names if startup_steps[name]["finished_at"] is None]
+        if not pending:
+            return True
+        if time.monotonic() >= deadline:
+            logging.warning("startup: continuing without %s after %.0fs", ", ".join(pending), timeout_s)
+            return False
+        sleep(0.05)
+
+def _sleep_until(deadline: float) -> None:
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        sleep(remaining)
+
+def _startup_version_step() -> None:
+    global current_version_label
+    current_version_label = _get_version_label()
+    if current_version_label:
+        logging.info("Version: %s", current_version_label)
+
+def _startup_firmware_step() -> bool:
+    _sleep_until(mcu_powered_at + UC_POWER_BOOT_DELAY_S)
+    return _verify_mcu_firmware()
+
+def _startup_storage_step() -> None:
+    if storage_location == 1:
+        _ensure_usb_mount()
+    # Switch lsyncd to the right config for the selected storage target.
+    switch_lsyncd_config(storage_location)
+
+# --- logging ---
+# Log calls only put the record on a queue; a listener thread formats it and writes in batches, so a
+# stalled SD card or journald never holds up the capture or the I2C loop.
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Same process, so records can cross as they are. Only arguments that could still change
+        # before the listener gets to them are rendered here.
+        args = record.args if isinstance(record.args, tuple) else (record.args,)
+        if record.args and not all(isinstance(arg, (str, int, float, type(None))) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+class BatchingLogListener(threading.Thread):
+    def __init__(self, records: queue.SimpleQueue, handlers: list):
+        super().__init__(name="log-listener", daemon=True)
+        self.records = records
+        self.handlers = handlers
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            record = self.records.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + LOG_BATCH_S
+            while len(batch) < LOG_BATCH_RECORDS:
+                try:
+                    record = self.records.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            for handler in self.handlers:
+                self._write(handler, batch)
+
+    @staticmethod
+    def _write(handler: logging.StreamHandler, batch: list) -> None:
+        records = [record for record in batch if record.levelno >= handler.level and handler.filter(record)]
+        if not records:
+            return
+        try:
+            text = "".join(handler.format(record) + handler.terminator for record in records)
+            with handler.lock:
+                if isinstance(handler, logging.handlers.RotatingFileHandler):
+                    if handler.stream is None:
+                        handler.stream = handler._open()
+                    if handler.maxBytes and handler.stream.tell() + len(text) >= handler.maxBytes:
+                        handler.doRollover()
+                handler.stream.write(text)
+                handler.flush()
+        except Exception:
+            handler.handleError(records[-1])
+
+    def stop(self, timeout_s: float = 2.0) -> None:
+        self.records.put(None)
+        self.join(timeout_s)
+
+def _setup_logging() -> None:
+    global log_listener
+    # file + stdout so journalctl includes full detail
+    file_handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
     file_handler.setLevel(logging.DEBUG)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.DEBUG)
     formatter = logging.Formatter("%(levelname)s:%(name)s:%(message)s")
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    logging.basicConfig(level=logging.DEBUG, handlers=[file_handler, console_handler])
+    log_listener = BatchingLogListener(log_queue, [file_handler, console_handler])
+    log_listener.start()
+    logging.root.handlers.clear()
+    logging.basicConfig(level=logging.DEBUG, handlers=[DeferredQueueHandler(log_queue)])
     logging.getLogger("picamera2").setLevel(logging.WARNING)
     logging.getLogger("libcamera").setLevel(logging.WARNING)
+    atexit.register(_stop_logging)
+
+def _stop_logging() -> None:
+    if log_listener is not None and log_listener.is_alive():
+        log_listener.stop()
+
+def _log_frame(index: int) -> bool:
+    """Whether the per-frame log lines of this frame are written (see --log-every)."""
+    return frame_log_every <= 1 or index % frame_log_every == 0
+
+
+# --- scheduling profiles ---
+# With --sched-profile, threads are pinned to cores by role. The main thread does the I2C polling and
+# the capture, so it takes the capture role while scanning and the other role the rest of the time.
+# Linux threads inherit affinity and policy from the thread that starts them: everything setup()
+# starts ends up in the other role, libcamera's threads in the camera role, and workers that belong
+# elsewhere switch themselves when they start.
+def _load_sched_profiles() -> dict:
+    profiles = dict(SCHED_PROFILES)
+    try:
+        with open(SCHED_PROFILES_PATH, "r", encoding="utf-8") as handle:
+            profiles.update(json.load(handle))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as exc:
+        logging.warning("sched: ignoring %s: %s", SCHED_PROFILES_PATH, exc)
+    return profiles
+
+def _setup_sched_profile() -> None:
+    global sched_roles
+    profiles = _load_sched_profiles()
+    if sched_profile not in profiles:
+        logging.warning(
+            "sched: unknown profile %r (have %s); leaving scheduling alone", sched_profile, ", ".join(profiles)
+        )
+        return
+    sched_roles = profiles[sched_profile]
+    unknown = sorted(set(sched_roles) - set(SCHED_ROLES))
+    if unknown:
+        logging.warning("sched: profile %s has unknown roles %s", sched_profile, ", ".join(unknown))
+    if sched_roles:
+        logging.info("sched: profile %s on CPUs %s", sched_profile, sorted(os.sched_getaffinity(0)))
+        _apply_sched_role("other")
+        _apply_sched_role("other", log_listener.native_id)  # the one thread that is older
+
+def _sched_warn(role: str, exc: OSError) -> None:
+    if role not in sched_warned:
+        sched_warned.add(role)
+        logging.warning("sched: can't fully apply the %s role: %s", role, exc)
+
+def _apply_sched_settings(role: str, settings: Optional[dict], tid: int = 0) -> None:
+    """Pin thread `tid` (0: the calling thread) to the role's CPUs and give it the role's priority."""
+    if not settings:
+        return
+    cpus = set(settings.get("cpus") or ()) & set(range(os.cpu_count() or 1))
+    try:
+        if cpus:
+            os.sched_setaffinity(tid, cpus)
+    except OSError as exc:
+        _sched_warn(role, exc)
+    if settings.get("fifo"):
+        try:
+            os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(settings["fifo"]))
+            return
+        except OSError as exc:  # no LimitRTPRIO: fall back to the nice value
+            _sched_warn(role, exc)
+    try:
+        if os.sched_getscheduler(tid) != os.SCHED_OTHER:
+            os.sched_setscheduler(tid, os.SCHED_OTHER, os.sched_param(0))
+        # On Linux the nice value belongs to the thread, not the process.
+        os.setpriority(os.PRIO_PROCESS, tid, settings.get("nice", 0))
+    except OSError as exc:
+        _sched_warn(role, exc)
+
+def _sched_settings(role: str) -> Optional[dict]:
+    return sched_roles.get(role) or sched_roles.get("other")
+
+def _apply_sched_role(role: str, tid: int = 0) -> None:
+    _apply_sched_settings(role, _sched_settings(role), tid)
+
+def _pin_lsyncd() -> None:
+    """Move lsyncd, and so the rsync processes it starts from now on, into the sync role."""
+    if not sched_roles:
+        return
+    try:
+        result = subprocess.run(
+            ["systemctl", "show", "-p", "MainPID", "--value", "filmkorn-lsyncd.service"],
+            capture_output=True,
+            text=True,
+            timeout=2.0,
+        )
+        pid = int(result.stdout.strip() or 0)
+        tids = [int(tid) for tid in os.listdir(f"/proc/{pid}/task")] if pid else []
+    except (OSError, ValueError, subprocess.SubprocessError) as exc:
+        logging.debug("sched: lsyncd not found: %s", exc)
+        return
+    for tid in tids:
+        _apply_sched_role("sync", tid)
+
+def _note_frame_start() -> None:
+    global sched_last_frame_start
+    now = time.monotonic()
+    if sched_last_frame_start is not None:
+        sched_frame_intervals.append(now - sched_last_frame_start)
+    sched_last_frame_start = now
+
+def _reset_sched_jitter() -> None:
+    global sched_last_frame_start
+    sched_frame_intervals.clear()
+    sched_wake_latencies.clear()
+    sched_last_frame_start = None
+
+def _log_sched_jitter() -> None:
+    """One line per scan: how regular the frame cadence and the main loop's wake-ups were."""
+    if len(sched_frame_intervals) < 2:
+        return
+    p50, p99 = np.percentile(np.asarray(sched_frame_intervals) * 1000.0, (50, 99))
+    line = "sched: profile %s, frame interval p50 %.1f ms, p99 %.1f ms (jitter %.1f ms)" % (
+        sched_profile, p50, p99, p99 - p50
+    )
+    if sched_wake_latencies:
+        late = np.asarray(sched_wake_latencies) * 1000.0
+        line += ", loop wake-up late by p50 %.2f ms, p99 %.2f ms, max %.2f ms" % (
+            np.percentile(late, 50), np.percentile(late, 99), late.max()
+        )
+    logging.info(line)
+
+
+# Now let's go
+def setup():
+    global PID_FILE_PATH, arduino, arduino_i2c_address, ssh_subprocess, state, camera, storage_location, sensor_size, preview_size, overlay_ready, overlay_supported, overlay_retry_count, overlay_retry_timer, current_resolution_switch, last_resolution_label, last_sleep_button_state, last_sleep_button_change, sleep_button_armed, dmesg_since, mcu_powered_at, startup_cache, resume_session
+    os.chdir("/home/pi/Filmkorn-Raw-Scanner/raspi")
+    
+    atexit.register(cleanup_terminal)
+    clear_tty1()
+
+    _setup_logging()
+    _setup_sched_profile()  # early, so every thread started from here on inherits the other role
 
     logging.info("----------------------------------------------------------------------------------")
     start_time = datetime.now()
+    startup_started_at = time.monotonic()
     dmesg_since = start_time.strftime('%Y-%m-%d %H:%M:%S')
     logging.info("Scanner started at %s", start_time.strftime('%Y-%m-%d %H:%M:%S'))
-    current_version_label = _get_version_label()
-    if current_version_label:
-        logging.info("Version: %s", current_version_label)
 
+    # ---- Make sure we only run once, to avoid horrible crashes ¯\_(ツ)_/¯ 
+    PID_FILE_PATH = "/tmp/scanner.pid"
+    # log a pid
+    try:
+        file = open(PID_FILE_PATH, "r+")
+    except OSError:
+        # no such file
+        file = open(PID_FILE_PATH, "w+")
+
+    with file:
+        contents = file.read()
+        if len(contents) != 0:
+            # file is not empty, it has a PID
+            if process_is_running(contents):
+                logging.error(f"Scan Process is already running with pid {contents}")
+                sys.exit(0)
+
+            file.seek(0)
+            file.truncate()
+
+        signal.signal(signal.SIGTERM, clear_pid_file)
+        atexit.register(clear_pid_file)
+        file.write(str(os.getpid()))
+    # ---- Done with the pid handling. ------------
+    atexit.register(_journal_flush)
+
+    startup_cache = _load_startup_cache()
 
     # Set the GPIO mode to BCM
     GPIO.setmode(GPIO.BCM)
 
     # --- Power up the Arduino/Controller MCU (required for I2C to respond) ---
     # The controller PCB gates 3.3V to the ATmega via GPIO16 (physical pin 36).
+    # Instead of sleeping through the boot delay, everything below runs while the MCU boots.
     GPIO.setup(UC_POWER_GPIO, GPIO.OUT, initial=GPIO.HIGH)
-    sleep(UC_POWER_BOOT_DELAY_S)
+    mcu_powered_at = time.monotonic()
 
     # GPIO 17 (BCM) input. "Resolution" switch is connected here.
     #   0 => Full-res RAW
@@ -1975,8 +5234,6 @@ def setup():
     GPIO.setup(5, GPIO.IN, pull_up_down=GPIO.PUD_UP)
     storage_location = GPIO.input(5)
     logging.info(f"GPIO 5 state (1=HDD/local, 0=Net/remote): {storage_location}")
-    if storage_location == 1:
-        _ensure_usb_mount()
 
     # GPIO 26 (BCM) input. Sleep/wake button (momentary, active low).
     GPIO.setup(26, GPIO.IN, pull_up_down=GPIO.PUD_OFF)
@@ -1984,17 +5241,37 @@ def setup():
     last_sleep_button_change = time.monotonic()
     sleep_button_armed = (last_sleep_button_state == 1)
 
-
     # Instanziate things
     state = State()
+
+    _start_storage_monitor()
+    _start_kmsg_monitor()
+    _start_thermal_governor()
+    _start_network_supervisor()
+    _start_frame_verifier()
+    if hdr_brackets > 1:
+        _start_hdr_merger()
+    if proxies_enabled:
+        _start_proxy_renderer()
+
+    # Independent startup steps run in the background while the camera comes up.
+    _start_startup_step("version", "Version", _startup_version_step)
+    _start_startup_step("firmware", "Controller firmware", _startup_firmware_step)
+    _start_startup_step("storage", "Storage target", _startup_storage_step)
+
+    _apply_sched_role("camera")  # inherited by the threads libcamera starts now...
     camera = Picamera2()
-    raw_format = None
-    for candidate in camera.sensor_modes:
-        if candidate.get("bit_depth") == SENSOR_BIT_DEPTH:
-            raw_format = candidate.get("unpacked") or candidate.get("format")
-            break
-    if raw_format is None:
-        raw_format = "SRGGB12"
+    _apply_sched_role("other")
+    camera.post_callback = _preview_frame_callback
+    if negative_preview:
+        camera.pre_callback = _negative_preview_callback
+    preview_analyzers.append(_focus_analyzer)
+    if exposure_assist:
+        preview_analyzers.append(_exposure_assist_analyzer)
+    if mjpeg_port:
+        _start_mjpeg_server()
+    if dng_compress:
+        camera.options["compress_level"] = 1
     overlay_ready = False
     overlay_supported = True
     overlay_retry_count = 0
@@ -2007,42 +5284,27 @@ def setup():
     sensor_size = camera.camera_configuration().get("sensor", {}).get("output_size", FULL_RESOLUTION)
     preview_size = camera.camera_configuration().get("main", {}).get("size", preview_size)
     _apply_camera_controls()
+    _apply_sched_role("camera")  # ...and by Picamera2's preview thread, which hands out the requests
     camera_start()
+    _apply_sched_role("other")
     overlay_ready = True
     _apply_overlay_if_ready()
-
-    # Switch lsyncd to the right config for the selected storage target.
-    switch_lsyncd_config(storage_location)
-    # ---- Make sure we only run once, to avoid horrible crashes ¯\_(ツ)_/¯ 
-    PID_FILE_PATH = "/tmp/scanner.pid"
-    # log a pid
-    try:
-        file = open(PID_FILE_PATH, "r+")
-    except OSError:
-        # no such file
-        file = open(PID_FILE_PATH, "w+")
-
-    with file:
-        contents = file.read()
-        if len(contents) != 0:
-            # file is not empty, it has a PID
-            if process_is_running(contents):
-                logging.error(f"Scan Process is already running with pid {contents}")
-                sys.exit(0)
-
-            file.seek(0)
-            file.truncate()
-
-        signal.signal(signal.SIGTERM, clear_pid_file)
-        atexit.register(clear_pid_file)
-        file.write(str(os.getpid()))
-    # ---- Done with the pid handling. ------------
+    _show_startup_progress()
 
     # init i2c comms 
     arduino = SMBus(1) # Indicates /dev/ic2-1 where the Arduino is connected
-    sleep(1) # wait a bit here to avoid i2c IO Errors
     arduino_i2c_address = 42 # This is the Arduino's i2c arduinoI2cAddress
 
+    # avrdude resets the MCU, so no I2C traffic before the firmware check is done.
+    if _wait_startup_steps(["firmware"], MCU_VERIFY_TIMEOUT_S + UC_POWER_BOOT_DELAY_S):
+        if startup_steps["firmware"]["result"]:
+            _run_mcu_flash_if_needed()
+    _sleep_until(mcu_powered_at + I2C_SETTLE_S) # wait a bit here to avoid i2c IO Errors
+    _wait_startup_steps(["storage", "version"], STARTUP_STEP_TIMEOUT_S)
+    resume_session = _find_interrupted_session()
+    if resume_session is not None:
+        _reship_unsynced_frames(resume_session)
+
     user_and_host = _read_user_and_host()
     host_path = _read_host_path()
     if user_and_host and host_path:
@@ -2055,10 +5317,9 @@ def setup():
         show_ready_to_scan()
     else:
         show_screen("no-host-computer-paired-yet")
-    if _verify_mcu_firmware():
-        _run_mcu_flash_if_needed()
     tell_arduino(Command.TELL_INITVALUES)
     logging.info("Asked Controller about the initial values. ")
+    logging.info("startup: ready after %.2fs", time.monotonic() - startup_started_at)
 
     ssh_subprocess = None
 
@@ -2109,8 +5370,8 @@ def loop():
             Command.Z3_1: set_zoom_mode_3_1,
             Command.Z10_1: set_zoom_mode_10_1,
             Command.SHOOT_RAW: shoot_raw,
-            Command.LAMP_ON: set_lamp_on,
-            Command.LAMP_OFF: set_lamp_off,
+            Command.LAMP_ON: light_button_on,
+            Command.LAMP_OFF: light_button_off,
             Command.START_SCAN: state.start_scan,
             Command.STOP_SCAN: state.stop_scan,
             Command.SET_EXP: set_exposure,
@@ -2124,22 +5385,123 @@ def loop():
 # end main control loop
 
 if __name__ == '__main__':
-    setup()
-
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
         '--continue-at', default=-1, type=int,
         help="continue writing to the previous directory",
         metavar="<next image no>")
+    parser.add_argument(
+        '--verify-firmware', action='store_true',
+        help="always read back and verify the controller flash, even if hex and signature are unchanged")
+
+    parser.add_argument(
+        '--blank-frames', choices=BLANK_FRAME_MODES, default="keep",
+        help="what to do with black, clear-leader and other featureless frames: keep them (only listed "
+             "in blank-frames.csv), skip writing them, or leave an empty <frame>.blank placeholder")
+
+    parser.add_argument(
+        '--measure-weave', action='store_true',
+        help="measure each frame's gate weave against the previous frame and write gate-weave.csv "
+             "(offsets in sensor pixels) next to the frames")
+
+    parser.add_argument(
+        '--weave-roi', type=_parse_weave_roi, default=WEAVE_DEFAULT_ROI, metavar="X,Y,W,H",
+        help="region around the perforation edge to measure on, as fractions of the frame "
+             f"(default {WEAVE_DEFAULT_ROI})")
+
+    parser.add_argument(
+        '--crop-to-gate', action='store_true',
+        help="store only the gate aperture of every raw (plus a small margin), as found on the empty gate "
+             "by the last flat-field calibration")
+
+    parser.add_argument(
+        '--no-scene-cuts', action='store_true',
+        help="don't look for scene cuts while scanning (and don't write scenes.edl)")
+
+    parser.add_argument(
+        '--mjpeg-port', type=int, default=None, metavar="PORT",
+        help="serve the live preview as MJPEG over HTTP on this port (paused while scanning)")
+
+    parser.add_argument(
+        '--mjpeg-fps', type=float, default=MJPEG_DEFAULT_FPS,
+        help=f"frame rate limit of the MJPEG preview (default {MJPEG_DEFAULT_FPS:g})")
+
+    parser.add_argument(
+        '--mjpeg-quality', type=int, default=MJPEG_DEFAULT_QUALITY, choices=range(1, 96), metavar="1-95",
+        help=f"JPEG quality of the MJPEG preview (default {MJPEG_DEFAULT_QUALITY})")
+
+    parser.add_argument(
+        '--proxies', action='store_true',
+        help="also write a small JPEG of every frame to proxies/ and a contact sheet of every 48 frames to "
+             "contact-sheets/ in the session, at idle priority")
+
+    parser.add_argument(
+        '--exposure-assist', action='store_true',
+        help="measure highlight headroom on the preview and suggest a shutter speed next to the current one")
+
+    parser.add_argument(
+        '--focus-peaking', action='store_true',
+        help="highlight in-focus edges on the preview in the 3:1 and 6:1 zoom modes")
+
+    parser.add_argument(
+        '--negative-preview', action='store_true',
+        help="show color negatives inverted and without the orange mask on the preview (saved raws are untouched)")
+
+    parser.add_argument(
+        '--no-calibration', action='store_true',
+        help="don't embed the cached flat-field and dark-frame corrections in the DNGs")
+
+    parser.add_argument(
+        '--hdr-brackets', type=int, choices=(1, 2, 3), default=1,
+        help="exposures per frame: 2 adds one at +2 EV, 3 adds +1.5 and +3 EV; merged into one 16-bit DNG "
+             "that keeps the set shutter speed as its base exposure")
+
+    parser.add_argument(
+        '--log-every', type=int, default=1, metavar="N",
+        help="only log every N-th frame's per-frame lines while scanning (warnings are always logged)")
+
+    parser.add_argument(
+        '--sched-profile', default="off", metavar="NAME",
+        help="pin the capture, camera, encode, analysis, preview and sync threads to cores and give capture "
+             f"real-time priority: {', '.join(SCHED_PROFILES)} or a profile from {SCHED_PROFILES_PATH} "
+             "(default off)")
+
+    parser.add_argument(
+        '--dng-compress', action='store_true',
+        help="write losslessly compressed (LJ92) DNGs: smaller frames, more CPU per frame")
 
     args = parser.parse_args()
+    force_mcu_verify = args.verify_firmware
+    dng_compress = args.dng_compress
+    frame_log_every = args.log_every
+    sched_profile = args.sched_profile
+    blank_frame_mode = args.blank_frames
+    exposure_assist = args.exposure_assist
+    focus_peaking = args.focus_peaking
+    negative_preview = args.negative_preview
+    calibration_enabled = not args.no_calibration
+    hdr_brackets = args.hdr_brackets
+    weave_roi = args.weave_roi if args.measure_weave else None
+    crop_to_gate = args.crop_to_gate
+    scene_cuts = not args.no_scene_cuts
+    proxies_enabled = args.proxies
+    mjpeg_port = args.mjpeg_port
+    mjpeg_fps = max(0.1, args.mjpeg_fps)
+    mjpeg_quality = args.mjpeg_quality
+
+    setup()
 
     if args.continue_at != -1:
-        state.raws_path = RAW_DIRS_PATH + os.path.join(
-            sorted(os.listdir(RAW_DIRS_PATH))[-1], '') + "{:08d}.dng"
-        state.raw_count = args.continue_at
+        if resume_session is not None:
+            session_dir, unsynced, crop = resume_session["dir"], resume_session["unsynced"], resume_session["crop"]
+            resume_session = None
+        else:
+            session_dir, unsynced, crop = RAW_DIRS_PATH + sorted(os.listdir(RAW_DIRS_PATH))[-1], None, None
+        os.makedirs(session_dir, exist_ok=True)
+        state.begin_session(session_dir, args.continue_at, unsynced, crop)
         state.continue_dir = True
+        state.proxies = proxies_enabled
         camera_start()
         shoot_raw()
 
@@ -2199,7 +5561,11 @@ if __name__ == '__main__':
                 and current_screen in {"ready-to-scan-local", "insert-film", "no-usb3-drive"}
             ):
                 _check_usb3_speed_warning()
-            if not state.scanning and now - last_resolution_check >= 0.5:
+            if exposure_assist and not state.scanning:
+                _refresh_exposure_assist_badge()
+            if state.zoom_mode != ZoomMode.Z1_1 and not state.scanning:
+                _refresh_focus_overlay(now)
+            if not state.scanning and not calibration_running and now - last_resolution_check >= 0.5:
                 new_resolution = GPIO.input(17)
                 if new_resolution != current_resolution_switch:
                     current_resolution_switch = new_resolution
@@ -2214,7 +5580,12 @@ if __name__ == '__main__':
             if shutting_down:
                 _start_shutdown_timer()
                 break
-            time.sleep(0.01 if state.scanning else 0.1) # less i2c collisions
+            if state.scanning:
+                slept_at = time.monotonic()
+                time.sleep(0.01)
+                sched_wake_latencies.append(time.monotonic() - slept_at - 0.01)
+            else:
+                time.sleep(0.1) # less i2c collisions
     except KeyboardInterrupt:
         print()
         sys.exit(1)